@@ -22,11 +22,13 @@ import abc
 import functools
 import logging
 
+import requests
+
 
 from .. import extract_base
+from .. import prefs
 from .. import util
 from .. import dbdrv
-from ..exceptions import ExtractSaveError
 
 
 log = logging.getLogger(__name__)
@@ -126,23 +128,43 @@ class ExtractAuctionBase(extract_base.ExtractBase):
         if len(existing_lots) != 0:
             existing_lots = existing_lots[0]
 
-        for lot_rdo in lots:
-            if lot_rdo['vendor_id'] in existing_lots:
-                continue
+        lots = [x for x in lots if x['vendor_id'] not in existing_lots]
 
+        # Image url for each lot, None if the image is already saved.
+        img_urls = []
+        for lot_rdo in lots:
             img_url, img_path = extract_base.urlpath_split(lot_rdo['img'])
             if img_url is not None and img_path is None:
+                img_urls.append(img_url)
+            else:
+                img_urls.append(None)
+
+        # Only downloads go through prefetch so the next images are fetched
+        # while earlier lots are inserted.  Deferred saves do no I/O.
+        now = not prefs['extract.save.defer']
+        if now:
+            dl_results = self.prefetch([x for x in img_urls if x is not None],
+                    now=True)
+
+        for lot_rdo, img_url in zip(lots, img_urls):
+            if img_url is not None:
                 log.debug('calling dl_save: {}'.format(img_url))
                 util.flush_log()
                 try:
-                    img_urlpath, _ = self.dl_save(img_url)
-                except ExtractSaveError as e:
+                    if now:
+                        img_urlpath, dlfile = next(dl_results).get()
+                    else:
+                        img_urlpath, dlfile = self.dl_save(img_url,
+                                now=False)
+                except (requests.RequestException, IOError, OSError) as e:
                     err = 'save error: {}'.format(util.exception_string(e))
                     log.error(err)
                     log.info('save error occurred for lot: {}'.format(
                             lot_rdo['desc']))
-                    img_urlpath = None
+                    img_urlpath, dlfile = None, None
 
+                if dlfile is not None:
+                    dlfile.close()
                 if img_urlpath is not None:
                     lot_rdo['img'] = img_urlpath
 
@@ -163,8 +185,14 @@ class ExtractAuctionBase(extract_base.ExtractBase):
 
         log.debug('updating: {}'.format(len(auctions)))
 
-        for auction_rdo in auctions:
-            self.update_lots(auction_rdo)
+        try:
+            for auction_rdo in auctions:
+                self.update_lots(auction_rdo)
+        except:
+            # Drop downloads still queued for a failed update.
+            self.close_pool(terminate=True)
+            raise
+        self.close_pool()
 
     def get_auction_ids(self):
         """Return list of ids for all auctions in this auction house."""
@@ -88,11 +88,8 @@ class AuctionHouseNode(ui_base.TreeRootNodeList):
         Returns:
             Sibling AuctionHouseNode.
         """
-        sibling = self.get_sibling(key)
-        if sibling['node'] is None:
-            sibling['node'] = AuctionHouseNode(self.ui,
-                    self.get_value_list(), key=key)
-        return sibling['node']
+        return self._sibling_node(key, lambda siblings, key:
+                AuctionHouseNode(self.ui, siblings, key=key))
 
     def get_ui(self):
         """Get ui_top.UIMain object."""
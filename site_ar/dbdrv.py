@@ -132,6 +132,22 @@ class SQLiteDriver(object):
         cursor.execute(sql, *args)
         return cursor
 
+    def executemany(self, sql, seq_of_args):
+        """Create a cursor and execute a sql statement once for each set of
+        parameterized arguments.
+
+        Args:
+            sql: sql command.
+            seq_of_args: iterable of parameterized argument sequences used as
+                SQL literals.
+
+        Returns:
+            sqlite3.Cursor after SQL statement execution.
+        """
+        cursor = self.cursor()
+        cursor.executemany(sql, seq_of_args)
+        return cursor
+
     def execall(self, sql, *args, **kwargs):
         """Create a cursor and fetch all results from a sql statement.
 
@@ -511,6 +527,9 @@ class RowDO(object):
     def __getitem__(self, key):
         return self._data[key]
 
+    def __contains__(self, key):
+        return key in self._data
+
     def __repr__(self):
         items = ', '.join(['{}={}'.format(k,v) for k,v in zip(self.keys(),
                 self.values())])
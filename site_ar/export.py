@@ -18,7 +18,6 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import collections
 import csv
 import functools
 import logging
@@ -81,11 +80,37 @@ def _pref_xlsx_currency_fmt_type(value):
     value = str(value).upper()
     keys = _XLSXCurrencyFormatMap.keys()
     if value not in keys:
-        log.info('currency_fmt must be in {}'.format(keys))
+        log.info('currency_fmt must be in %s', keys)
         raise PreferencesTypeError('currency_fmt must be in {}'.format(keys))
     return value
 
 
+# Map of preference value to PIL.Image filter attribute.  Attributes are
+# resolved when used since PIL is not required.
+_XLSXImgResampleMap = {
+    'BICUBIC': 'BICUBIC',
+    'BILINEAR': 'BILINEAR',
+    'LANCZOS': 'LANCZOS',
+}
+
+
+def _pref_xlsx_img_resample_type(value):
+    """type converter for export.xlsx.img.resample preference.
+
+    Args:
+        value: string to convert.
+
+    Returns:
+        matching string.
+    """
+    value = str(value).upper()
+    keys = _XLSXImgResampleMap.keys()
+    if value not in keys:
+        log.info('resample must be in %s', keys)
+        raise PreferencesTypeError('resample must be in {}'.format(keys))
+    return value
+
+
 def _mp_write_rels(self):
     """Replacement function for
     openpyxl.drawing.spreadsheet_drawing.SpreadsheetDrawing._write_rels.
@@ -103,30 +128,38 @@ def _mp_write_rels(self):
 
     if hasattr(self.images[0], 'path'):
         # Get path version >= 2.4.0
-        image_name_mapping = [os.path.basename(x.path) for x in self.images]
+        path_attr = 'path'
     else:
         # Get path version < 2.4.0
-        image_name_mapping = [os.path.basename(x._path) for x in self.images]
-    image_name_mapping = {os.path.splitext(x)[0]: x for x
-            in image_name_mapping}
+        path_attr = '_path'
+
+    # Paths inside the xlsx (zip) file always use '/' so split with
+    # rpartition instead of the platform dependent os.path functions.
+    image_name_mapping = {}
+    for img in self.images:
+        img_file = getattr(img, path_attr).rpartition('/')[2]
+        img_stem = img_file.rpartition('.')[0] or img_file
+        image_name_mapping[img_stem] = img_file
 
     for rel in tree.iterchildren():
-        rel_dir, rel_file = os.path.split(rel.get('Target'))
-        img_file = image_name_mapping.get(os.path.splitext(
-                rel_file)[0], None)
+        rel_dir, _, rel_file = rel.get('Target').rpartition('/')
+        rel_stem = rel_file.rpartition('.')[0] or rel_file
+        img_file = image_name_mapping.get(rel_stem, None)
 
         if img_file is None or img_file == rel_file:
             continue
 
-        log.debug('changing rel {} -> {}'.format(rel_file, img_file))
-        rel.set('Target', os.path.join(rel_dir, img_file))
+        log.debug('changing rel %s -> %s', rel_file, img_file)
+        if rel_dir != '':
+            img_file = rel_dir + '/' + img_file
+        rel.set('Target', img_file)
     return tree
 
 
 def is_mp_write_rels():
     """Returns tree if _write_rels has been monkey-patched with
     _mp_write_rels."""
-    return SpreadsheetDrawing._write_rels.im_func == _mp_write_rels
+    return vars(SpreadsheetDrawing).get('_write_rels') is _mp_write_rels
 
 
 def mp_write_rels():
@@ -156,7 +189,7 @@ def _pref_jpeg_en_on_change(pref, value, user_data):
         value: bool
         user_data: unused
     """
-    log.debug('value jpeg_en changed to: {}'.format(value))
+    log.debug('value jpeg_en changed to: %s', value)
     try:
         if value is True:
             mp_write_rels()
@@ -166,31 +199,46 @@ def _pref_jpeg_en_on_change(pref, value, user_data):
         pass
 
 
-prefs.add('export.default_csv', bool, True, default=False,
-        help='True to export using csv files')
-prefs.add('export.image.resize.max_height', int, True, default=200,
-        help='Max height in pixels for image exports')
-prefs.add('export.image.resize.max_width', int, True, default=200,
-        help='Max width in pixels for image exports')
-prefs.add('export.tree.use_cache', bool, True, default=True,
-        help='True to export using cache values from tree view.  False to '
-        'always export fresh objects from the database')
-prefs.add('export.xlsx.currency_fmt', _pref_xlsx_currency_fmt_type, True,
-        default='USD', help='Currency format used in xlsx exports.  Valid '
-        'choices are (USD,GBP,EUR)')
-prefs.add('export.xlsx.img.jpeg.enable', bool, True, default=True,
-        on_change=_pref_jpeg_en_on_change,
-        help='(EXPERIMENTAL) Convert images to jpeg when exporting xlsx.  '
-        'Openpyxl only uses png and this requires monkey patching openpyxl '
-        'and pillow')
-prefs.add('export.xlsx.img.jpeg.quality', int, True, default=90,
-        help='quality setting for pillow when exporting jpeg images')
-prefs.add('export.xlsx.img.multiplier.height', float, True, default=0.76,
-        help='xlsx row ht attribute multiplier for images (per pixels)')
-prefs.add('export.xlsx.img.multiplier.width', float, True, default=0.108,
-        help='xlsx col width attribute multiplier for images (per pixels)')
-prefs.add('export.xlsx.text.multiplier.width', float, True, default=1.0,
-        help='xlsx col width attribute multiplier text (per char)')
+_PREFS_SCHEMA = (
+    dict(key='export.default_csv', value_type=bool, required=True,
+            default=False, help='True to export using csv files'),
+    dict(key='export.image.resize.max_height', value_type=int,
+            required=True, default=200,
+            help='Max height in pixels for image exports'),
+    dict(key='export.image.resize.max_width', value_type=int, required=True,
+            default=200, help='Max width in pixels for image exports'),
+    dict(key='export.tree.use_cache', value_type=bool, required=True,
+            default=True, help='True to export using cache values from tree '
+            'view.  False to always export fresh objects from the database'),
+    dict(key='export.xlsx.currency_fmt',
+            value_type=_pref_xlsx_currency_fmt_type, required=True,
+            default='USD', help='Currency format used in xlsx exports.  '
+            'Valid choices are (USD,GBP,EUR)'),
+    dict(key='export.xlsx.img.jpeg.enable', value_type=bool, required=True,
+            default=True, on_change=_pref_jpeg_en_on_change,
+            help='(EXPERIMENTAL) Convert images to jpeg when exporting '
+            'xlsx.  Openpyxl only uses png and this requires monkey patching '
+            'openpyxl and pillow'),
+    dict(key='export.xlsx.img.jpeg.quality', value_type=int, required=True,
+            default=90, help='quality setting for pillow when exporting jpeg '
+            'images'),
+    dict(key='export.xlsx.img.resample',
+            value_type=_pref_xlsx_img_resample_type, required=True,
+            default='BICUBIC', help='Filter used to resize images in xlsx '
+            'exports.  Valid choices are (BICUBIC,BILINEAR,LANCZOS).  '
+            'LANCZOS is the slowest with little visible difference at '
+            'thumbnail size'),
+    dict(key='export.xlsx.img.multiplier.height', value_type=float,
+            required=True, default=0.76, help='xlsx row ht attribute '
+            'multiplier for images (per pixels)'),
+    dict(key='export.xlsx.img.multiplier.width', value_type=float,
+            required=True, default=0.108, help='xlsx col width attribute '
+            'multiplier for images (per pixels)'),
+    dict(key='export.xlsx.text.multiplier.width', value_type=float,
+            required=True, default=1.0, help='xlsx col width attribute '
+            'multiplier text (per char)'),
+)
+prefs.add_many(_PREFS_SCHEMA)
 
 
 def key_intersection(export_keys, obj_keys, obj_type, warn_on_missing=True):
@@ -253,7 +301,7 @@ class CSVExporter(object):
         Args:
             iterable: string or list of strings.  One item per column.
         """
-        if isinstance(iterable, basestring):
+        if isinstance(iterable, util.STRING_TYPES):
             iterable = [iterable,]
         self.writer.writerow(iterable)
 
@@ -301,10 +349,9 @@ def _openpyxl_support(simulate_no_openpyxl=False):
     """
     global __openpyxl_support
     if __openpyxl_support is None:
-        if simulate_no_openpyxl is False \
-                and sys.modules.has_key('openpyxl') is True:
+        if simulate_no_openpyxl is False and 'openpyxl' in sys.modules:
             __openpyxl_support = True
-            log.debug('using openpyxl version: {}'.format(openpyxl_version))
+            log.debug('using openpyxl version: %s', openpyxl_version)
         else:
             __openpyxl_support = False
             log.warn('openpyxl not installed, falling back to CSVExporter')
@@ -411,7 +458,7 @@ def is_mp_pil_image_save(img):
     if not isinstance(img.save, functools.partial):
         return False
 
-    return img.save.func.im_func == _mp_pil_image_save
+    return img.save.func.__func__ is _mp_pil_image_save
 
 
 def mp_pil_image_save(img, fmt, params):
@@ -452,17 +499,30 @@ def mr_pil_image_save(img):
 
 class XLSXCurrency(float):
     """Provides unique type and __len__ for write_row.  This is a subclass of
-    float instead of string so setting number_format in the cell works.
+    float instead of string so setting number_format in the cell works.  The
+    display length is calculated once on creation.
     """
-    def __len__(self):
+    __slots__ = ('_display_len',)
+
+    def __new__(cls, value):
+        obj = super(XLSXCurrency, cls).__new__(cls, value)
         # More conservative to use round instead of int to compensate for
-        # inaccuracy in log (math.log(1000, 10) < 3).
-        length = int(round(math.log(self, 10)))
+        # inaccuracy in log (math.log(1000, 10) < 3).  log is undefined for
+        # 0 and negative values use their magnitude.
+        magnitude = abs(obj)
+        if magnitude > 0:
+            length = int(round(math.log(magnitude, 10)))
+        else:
+            length = 0
         # Add commas.
-        length += length / 3
+        length += length // 3
         # ones place (1) + decimal/cents (3) + symbols (1) + negative (1)
         length += 6
-        return length
+        obj._display_len = length
+        return obj
+
+    def __len__(self):
+        return self._display_len
 
 
 class XLSXExporter(object):
@@ -515,6 +575,9 @@ class XLSXExporter(object):
         self.widths = []
         self._other_widths = []
         self.img_support = _openpyxl_img_support()
+        # Index of the last row written.  Tracked here since
+        # ws.max_row scans every cell in the worksheet on each access.
+        self._row_idx = 0
 
     def close(self):
         """Close export file."""
@@ -523,7 +586,7 @@ class XLSXExporter(object):
         self.wb.save(self.path)
         self.ws = None
         self.wb = None
-        log.debug('xlsx column widths: {}'.format(self.widths))
+        log.debug('xlsx column widths: %s', self.widths)
 
     def _set_col_widths(self):
         """Sets column width attributes in export file with values saved
@@ -578,6 +641,20 @@ class XLSXExporter(object):
         if height is not None:
             self.ws.row_dimensions[row].height = height
 
+    def _apply_row_font(self, row, count, font):
+        """Sets font in cells for a given row.
+
+        Args:
+            row: int row index.
+            count: int number of cells in row.
+            font: openpyxl font.
+        """
+        if font is None:
+            return
+
+        for col in range(1, count + 1):
+            self.ws.cell(column=col, row=row).font = font
+
     def _apply_img(self, row, col_img_pairs):
         """Embeds images incells for a given row.
 
@@ -592,7 +669,7 @@ class XLSXExporter(object):
             cell = self.ws.cell(column=col, row=row)
             self.ws.add_image(img, cell.coordinate)
 
-    def write_row(self, iterable, multiplier=1):
+    def write_row(self, iterable, multiplier=1, font=None):
         """Writes single row to xlsx file.
 
         Args:
@@ -600,9 +677,11 @@ class XLSXExporter(object):
                 openpyxl/PIL images.
             multiplier (optional): float multiplier applied to calculated
                 column width.
+            font (optional): openpyxl font applied to each cell in the row.
         """
-        if isinstance(iterable, basestring) \
-                or not isinstance(iterable, collections.Iterable):
+        # Duck-type test, the Iterable ABC check is slow for a per row call.
+        if isinstance(iterable, util.STRING_TYPES) \
+                or not hasattr(iterable, '__iter__'):
             iterable = [iterable,]
 
         text_multiplier = prefs['export.xlsx.text.multiplier.width'] \
@@ -624,15 +703,15 @@ class XLSXExporter(object):
                 cell_text.append(value)
                 if isinstance(value, XLSXCurrency):
                     col_fmt_pairs.append((col, FMT_CURRENCY))
-                    row_widths.append(len(value) * text_multiplier)
-                elif isinstance(value, basestring):
+                    row_widths.append(value._display_len * text_multiplier)
+                elif isinstance(value, util.STRING_TYPES):
                     row_widths.append(len(value) * text_multiplier)
                 elif value is not None:
                     row_widths.append(len(str(value)) * text_multiplier)
                 else:  # Effectively None
                     row_widths.append(None)
             elif isinstance(value, (OpenpyxlImage, PILImage.Image)):
-                log.info('embedding image: {}'.format(value))
+                log.info('embedding image: %s', value)
 
                 if isinstance(value, PILImage.Image):
                     value = self.image(value)
@@ -656,17 +735,12 @@ class XLSXExporter(object):
             raise ExportError(err)
 
         self.ws.append(cell_text)
-
-        # wait until after append to get the current row, to cover the
-        # ambiguous empty worksheet case.  See below:
-        # ws = new worksheet
-        # ws.max_row returns 1
-        # ws.append(data)
-        # ws.max_row returns 1
-        row = self.ws.max_row
+        self._row_idx += 1
+        row = self._row_idx
 
         self._apply_img(row, col_img_pairs)
         self._apply_row_number_format(row, col_fmt_pairs)
+        self._apply_row_font(row, len(cell_text), font)
         self._apply_width(row_widths)
         self._apply_row_height(row, row_height)
 
@@ -676,15 +750,7 @@ class XLSXExporter(object):
         Args:
             iterable: string or list of strings.
         """
-        self.write_row(iterable, multiplier=1.1)
-        try:
-            # Get row version < 2.4.0
-            row = self.ws.rows[self.ws.max_row - 1]
-        except:
-            # Get row version >= 2.4.0
-            row = self.ws[self.ws.max_row]
-        for cell in row:
-            cell.font = Font(bold=True)
+        self.write_row(iterable, multiplier=1.1, font=Font(bold=True))
 
     def write_blank(self, count=1):
         """Write blank lines to csv file.
@@ -694,6 +760,7 @@ class XLSXExporter(object):
         """
         # No openpyxl function to handle this.
         self.ws._current_row += count
+        self._row_idx += count
 
     def image(self, img, jpeg=None):
         """Creates a compatible image that may be embedded into a xlsx file.
@@ -725,7 +792,9 @@ class XLSXExporter(object):
                 prefs['export.image.resize.max_height'])
         # thumbnail will preserve aspect ratio using size as a max width or
         # height and only scale down.
-        img.thumbnail(size, resample=PILImage.LANCZOS)
+        resample = getattr(PILImage, _XLSXImgResampleMap[
+                prefs['export.xlsx.img.resample']])
+        img.thumbnail(size, resample=resample)
 
         if jpeg is None:
             jpeg = prefs['export.xlsx.img.jpeg.enable']
@@ -19,15 +19,26 @@
 # SOFTWARE.
 
 import abc
+import collections
+import errno
+import hashlib
 import logging
 import os
 import random
+import re
+import tempfile
+import threading
 import time
+from multiprocessing.pool import ThreadPool
 
 try:
-    from urllib.request import urlopen
-except:
-    from urllib2 import urlopen
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 
 
 from . import prefs
@@ -38,21 +49,103 @@ from .exceptions import *
 log = logging.getLogger(__name__)
 
 
-prefs.add('extract.save.defer', bool, True, default=True,
-        help='True to wait until images are needed to download.  False to '
-        'download immediately')
-prefs.add('extract.req_throttle', bool, True, default=False,
-        help='True to enable request throttling')
-prefs.add('extract.req_throttle.base', float, True, default=0.5,
-        help='Base value in seconds to wait between throttled requests')
-prefs.add('extract.req_throttle.var', float, True, default=0.2,
-        help='Random max value in seconds req_throttle.base')
+_PREFS_SCHEMA = (
+    dict(key='extract.save.defer', value_type=bool, required=True,
+            default=True, help='True to wait until images are needed to '
+            'download.  False to download immediately'),
+    dict(key='extract.req_throttle', value_type=bool, required=True,
+            default=False, help='True to enable request throttling'),
+    dict(key='extract.req_throttle.base', value_type=float, required=True,
+            default=0.5, help='Base value in seconds to wait between '
+            'throttled requests'),
+    dict(key='extract.req_throttle.var', value_type=float, required=True,
+            default=0.2, help='Random max value in seconds '
+            'req_throttle.base'),
+)
+prefs.add_many(_PREFS_SCHEMA)
+
+
+# Seconds to wait on connect/read before a request is abandoned.
+REQ_TIMEOUT = 30
+
+# Max downloads in flight to a single host from the download pool, matching
+# the per-host connection limit browsers use.
+MAX_HOST_DOWNLOADS = 6
+
+# Bytes read from a response at a time when saving downloaded files.
+DL_CHUNK_SIZE = 65536
+
+# Filename from a content-disposition header (RFC 6266), group 1 is a quoted
+# filename and group 2 is a token or extended filename*.
+_CD_FILENAME = re.compile(r'filename\*?\s*=\s*(?:"([^"]+)"|([^;]+))', re.I)
+
+
+# Python 2 has no monotonic clock in the time module.
+_monotonic = getattr(time, 'monotonic', time.time)
+
+
+class HostThrottle(object):
+    """Spaces out requests to a single host.  Each request or finished
+    download pushes the next allowed request base +/- var seconds into the
+    future.  Waiting only holds this host's lock so requests to other hosts
+    are never stalled."""
+
+    def __init__(self, base, var):
+        """Initializer.
+
+        Args:
+            base: float base seconds between requests.
+            var: float max random seconds added to or removed from base.
+        """
+        self.base = base
+        self.var = var
+        self.req_next = 0
+        self._lock = threading.Lock()
+
+    def stall(self):
+        """Seconds to wait before the next request, 0 if none."""
+        return max(0, self.req_next - _monotonic())
+
+    def mark(self):
+        """Mark activity on this host and schedule the next request."""
+        self.req_next = _monotonic() + self.base + \
+                (random.random() * 2 * self.var) - self.var
+
+    def wait(self):
+        """Block until a request is allowed then mark it."""
+        with self._lock:
+            stall = self.stall()
+            if stall > 0:
+                time.sleep(stall)
+            self.mark()
+
+
+def _new_session():
+    """Create a requests session with a pooled adapter mounted for http and
+    https so connections to the same host are kept alive and reused.
+
+    Returns:
+        requests.Session object.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=20, pool_maxsize=50,
+            max_retries=Retry(total=3, backoff_factor=0.5,
+            status_forcelist=(500, 502, 503, 504)))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
 
 # URLPATH Format: [<__url__><url>] [<__path__><path>]
 # Since a url can not have a space but a path can path must always follow the
 # url if present so the first encountered space is the delimeter between the
 # two.
+_URL_TAG = '__url__'
+_URL_TAG_LEN = len(_URL_TAG)
+_PATH_TAG = '__path__'
+_PATH_TAG_LEN = len(_PATH_TAG)
+
+
 def urlpath_join(url, path):
     """Join file url and path to save in database.  Since a url can not have
     a space the two strings are tagged and joined by a space in the format:
@@ -70,25 +163,27 @@ def urlpath_join(url, path):
     if not util.isnonestr(path):
         raise TypeError('path must be type None or basestring')
 
-    ret = []
-
-    url = url or ''
-    if len(url):
-        if url.find(' ') != -1:
+    if url:
+        if ' ' in url:
             raise ValueError('url \'{}\' can not have spaces'.format(url))
-        ret.append('__url__' + url)
+        if path:
+            return _URL_TAG + url + ' ' + _PATH_TAG + path
+        return _URL_TAG + url
+
+    if path:
+        return _PATH_TAG + path
+    return None
 
-    path = path or ''
-    if len(path):
-        ret.append('__path__' + path)
 
-    if len(ret) == 0:
-        return None
-    return ' '.join(ret)
+# Memoized urlpath_split results by urlpath, cleared when full.  The same
+# urlpaths are split repeatedly as the UI and exporters revisit rows.
+_urlpath_split_cache = {}
+_URLPATH_SPLIT_CACHE_MAX = 8192
 
 
 def urlpath_split(urlpath):
-    """Splits properly formatted urlpath into url and path.
+    """Splits properly formatted urlpath into url and path.  Results are
+    memoized, invalid urlpaths raise every time and are not cached.
 
     Args:
         urlpath: urlpath string
@@ -96,29 +191,47 @@ def urlpath_split(urlpath):
     Returns:
         tuple (url, path) where url and path may be string or None.
     """
+    try:
+        return _urlpath_split_cache[urlpath]
+    except (KeyError, TypeError):
+        # TypeError is an unhashable urlpath which _urlpath_split rejects.
+        pass
+
+    ret = _urlpath_split(urlpath)
+    if len(_urlpath_split_cache) >= _URLPATH_SPLIT_CACHE_MAX:
+        _urlpath_split_cache.clear()
+    _urlpath_split_cache[urlpath] = ret
+    return ret
+
+
+def _urlpath_split(urlpath):
+    """Uncached urlpath_split."""
     if not util.isnonestr(urlpath):
         raise TypeError('urlpath must be type None or basestring')
 
     if urlpath is None or len(urlpath) == 0:
         return None, None
 
-    if urlpath.startswith('__url__'):
+    if urlpath.startswith(_URL_TAG):
         # Keep urlpath if needed for exception below.
-        url = urlpath.split(' ', 1)
-        path = util.getindex(url, 1, None)
-        url = url[0][7:]
-        if url.find('__path__') != -1:
+        sp = urlpath.find(' ')
+        if sp != -1:
+            url = urlpath[_URL_TAG_LEN:sp]
+            path = urlpath[sp + 1:]
+        else:
+            url = urlpath[_URL_TAG_LEN:]
+            path = None
+        if _PATH_TAG in url:
             log.warn('url: \'{}\' contains __path__, may be a bug'.format(
                     url))
     else:
         url = None
         path = urlpath
 
-    #if path is not None and path.startswith('__path__'):
-    if isinstance(path, basestring):
-        if path.startswith('__path__'):
-            path = path[8:]
-            if path.find('__url__') != -1:
+    if path is not None:
+        if path.startswith(_PATH_TAG):
+            path = path[_PATH_TAG_LEN:]
+            if _URL_TAG in path:
                 log.warn('path: \'{}\' contains __url__, may be a bug'.format(
                         path))
         else:
@@ -131,7 +244,12 @@ def urlpath_split(urlpath):
 class ExtractBase(object):
     __metaclass__ = abc.ABCMeta
 
-    def __init__(self, db, dl_dir, req_throttle=None, req_stall=(None, None)):
+    # Shared by all extractors so keep-alive connections are reused across
+    # requests instead of paying a new TCP/TLS handshake per url.
+    _session = _new_session()
+
+    def __init__(self, db, dl_dir, req_throttle=None, req_stall=(None, None),
+            max_workers=8, prefetch_slots=2):
         """Initializer for extractor base class.  Can not be used on its own.
 
         Args:
@@ -142,11 +260,18 @@ class ExtractBase(object):
             req_stall (optional): tuple of (throttle base, throttle var)
                 floats.  If left unset these values will be based on
                 preferences.
+            max_workers (optional): int number of download threads used by
+                dl_save_async and prefetch.
+            prefetch_slots (optional): int number of queued downloads per
+                worker allowed ahead of the caller in prefetch.
         """
         util.require_dir(dl_dir)
 
         self.db = db
         self.dl_dir = dl_dir
+        # dl_dir ending in a separator, joined with relative paths by plain
+        # concatenation.
+        self._dl_dir_prefix = os.path.join(dl_dir, '')
 
         if req_throttle is None:
             self.req_throttle = prefs['extract.req_throttle']
@@ -158,7 +283,13 @@ class ExtractBase(object):
         self.req_stall_base = req_stall[0] \
                 or prefs['extract.req_throttle.base']
         self.req_stall_var = req_stall[1] or prefs['extract.req_throttle.var']
-        self.req_last = 0
+        self._throttles = {}
+        self._host_slots = {}
+        self._hosts_lock = threading.Lock()
+
+        self.max_workers = max_workers
+        self.prefetch_slots = prefetch_slots
+        self._pool = None
 
         self.db_ready = False
         self.id = None
@@ -170,31 +301,59 @@ class ExtractBase(object):
             url: string (must include http://)
 
         Returns:
-            request object or None.
+            requests.Response object or None.
         """
         if self.req_throttle:
-            req_next = self.req_last + self.req_stall_base
-            req_next += (random.random() * 2 * self.req_stall_var) \
-                    - self.req_stall_var
-            now = time.time()
-            if req_next > now:
-                time.sleep(req_next - now)
-
-            # Mark req_last to prevent spamming requests (will happen again
+            # Marks the host to prevent spamming requests (will happen again
             # in _dl so the delay actually happens after the last activity).
-            self.req_last = time.time()
+            self._host_throttle(url).wait()
 
-        # TODO: handle connection refused.
-        #urllib2.URLError, need to figure out what python3 would be.
-        req = urlopen(url)
+        # TODO: handle connection refused (requests.ConnectionError).
+        req = self._session.get(url, stream=True, timeout=REQ_TIMEOUT)
 
         return req
 
+    def _host_throttle(self, url):
+        """HostThrottle for the host of url, created on first use."""
+        host = urlparse(url).netloc
+        with self._hosts_lock:
+            throttle = self._throttles.get(host)
+            if throttle is None:
+                throttle = HostThrottle(self.req_stall_base,
+                        self.req_stall_var)
+                self._throttles[host] = throttle
+        return throttle
+
+    def _host_semaphore(self, url):
+        """Semaphore limiting downloads to the host of url to
+        MAX_HOST_DOWNLOADS, created on first use."""
+        host = urlparse(url).netloc
+        with self._hosts_lock:
+            slots = self._host_slots.get(host)
+            if slots is None:
+                slots = threading.BoundedSemaphore(MAX_HOST_DOWNLOADS)
+                self._host_slots[host] = slots
+        return slots
+
+    def should_stall(self, url):
+        """Seconds a request to url would currently be stalled by
+        throttling.  Lets callers schedule requests to other hosts first.
+
+        Args:
+            url: string (must include http://)
+
+        Returns:
+            float seconds, 0 if the request would not stall.
+        """
+        if not self.req_throttle:
+            return 0
+        return self._host_throttle(url).stall()
+
     def _req_ext(self, req):
         """Extract file extension from request object.
 
         Args:
-            req: request object.
+            req: requests.Response object.
 
         Returns:
             string of extension without leading '.'
@@ -206,20 +365,21 @@ class ExtractBase(object):
 
         # 2) Check content-disposition, used by server to suggest default
         #    filename.
-        if req.info().has_key('content-disposition'):
-            filename = req.info()['content-disposition']
-            filename = filename.split('filename=')
-            filename = filename.replace('"', '')
-            filename = filename.replace(';', '')
-            _, ext = os.path.splitext(req.url)
+        match = _CD_FILENAME.search(req.headers.get('content-disposition',
+                ''))
+        if match is not None:
+            filename = (match.group(1) or match.group(2)).strip()
+            _, ext = os.path.splitext(os.path.basename(filename))
             if ext != '':
                 return ext[1:]
 
         # 3) Fall back to content-type.  This is less than ideal since we may
         #    end up with 'octect-stream' as an extension.  It should be fine
         #    if we continue to just deal with images.
-        if req.headers.subtype and req.headers.subtype != '':
-            return req.headers.subtype
+        content_type = req.headers.get('content-type', '')
+        subtype = content_type.split(';', 1)[0].partition('/')[2].strip()
+        if subtype != '':
+            return subtype
 
         # Another alternative would be passing the data through magic or
         # binwalk.
@@ -227,23 +387,27 @@ class ExtractBase(object):
         log.warn('unknown extension for url: {}'.format(req.url))
         return 'unk'
 
-    def _dl(self, req):
+    def _dl(self, req, url):
         """Download data from request object.
 
         Args:
-            req: request object.
+            req: requests.Response object.
+            url: requested url string, used for throttling since req.url is
+                the url after any redirects.
 
         Returns:
             data in string format.
         """
-        if req.code != 200:
+        if req.status_code != 200:
+            # Release the connection back to the pool unread.
+            req.close()
             return None
 
-        data = req.read()
+        data = req.content
 
         # If throttling mark last download time after read is done.
         if self.req_throttle:
-            self.req_last = time.time()
+            self._host_throttle(url).mark()
 
         return data
 
@@ -256,18 +420,18 @@ class ExtractBase(object):
         Returns:
             data in string format.
         """
-        return self._dl(self.request(url))
+        return self._dl(self.request(url), url)
 
-    def _open_dl_file(self, path, mode='r'):
+    def _open_dl_file(self, path, mode='rb'):
         """Open a file from the download directory.
 
         Args:
             path: path string relative to the download directory.
-            mode (optional): open mode string, default is 'r'.
+            mode (optional): open mode string, default is 'rb'.
         Returns:
             file pointer or None.
         """
-        return util.tryopen(os.path.join(self.dl_dir, path), mode)
+        return util.tryopen(self._dl_dir_prefix + path, mode)
 
     def _dl_file(self, url, ext=None):
         """Download and save file to download directory.
@@ -278,38 +442,83 @@ class ExtractBase(object):
                 try to be determined by _req_ext.
 
         Returns:
-            string path to file based on md5 of data relative to download
-            directory or None.
+            tuple of (path, file) or (None, None) if an error occurred.  path
+            is a string based on md5 of data relative to download directory.
+            file is the saved file opened for read at position 0.
         """
         req = self.request(url)
         if req is None:
-            return None
+            return None, None
+
+        if req.status_code != 200:
+            req.close()
+            return None, None
 
         if ext is None:
             ext = self._req_ext(req)
+        if ext.find(os.path.sep) != -1:
+            req.close()
+            raise ValueError('extension must not contain {}'.format(
+                    os.path.sep))
+
+        # Read the response in chunks feeding md5 and a temporary file in the
+        # download directory which is linked to the md5 path when done.  This
+        # keeps large files out of memory.  The file is kept open and
+        # returned so callers do not need to open it again.
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.dl_dir)
+        except (IOError, OSError) as e:
+            log.warn('could not open temporary file for write: {}'.format(
+                    util.exception_string(e)))
+            req.close()
+            return None, None
+
+        dlfile = os.fdopen(fd, 'w+b')
+        digest = hashlib.md5()
+        try:
+            for chunk in req.iter_content(DL_CHUNK_SIZE):
+                digest.update(chunk)
+                dlfile.write(chunk)
+        except:
+            dlfile.close()
+            os.remove(tmp_path)
+            raise
 
-        # Note: if this is going to download very large files it would be best
-        # to read chunks from the request while at the same time feeding it
-        # through md5 and writing to a temporary file which can be moved
-        # to the correct path later.
-        data = self._dl(req)
-
-        path = util.md5_path(data, self.dl_dir, ext)
-        if path is None:
-            # If we run out of paths we probably downloaded the file (or
-            # empty files) too many times.
-            err = 'Could not find unused path for {}'.format(req.url)
-            raise ExtractSaveError(err)
-
-        wfile = self._open_dl_file(path, 'w')
-        if wfile is None:
-            log.warn('could not open {} for write'.format(path))
-            return None
-
-        wfile.write(data)
-        wfile.close()
-
-        return path
+        # If throttling mark last download time after read is done.
+        if self.req_throttle:
+            # Same host request() waited on, not the redirected req.url.
+            self._host_throttle(url).mark()
+
+        # Files are content addressed so an existing file at the md5 path
+        # already holds this data.  Linking fails atomically in that case
+        # instead of probing for an unused path.
+        path = '{}{}{}'.format(digest.hexdigest(), os.path.extsep, ext)
+        dest = self._dl_dir_prefix + path
+        renamed = False
+        try:
+            try:
+                # Temporary files are created private, match a normal open.
+                os.chmod(tmp_path, 0o644)
+                os.link(tmp_path, dest)
+            except OSError as e:
+                if e.errno == errno.EEXIST:
+                    log.debug('{} already downloaded'.format(path))
+                else:
+                    # Filesystem without hard links (vfat, some network
+                    # mounts).  Replacing an existing file is harmless as it
+                    # holds the same data.
+                    os.rename(tmp_path, dest)
+                    renamed = True
+        except OSError:
+            dlfile.close()
+            raise
+        finally:
+            # dlfile stays readable after the temporary name is removed.
+            if not renamed:
+                os.remove(tmp_path)
+
+        dlfile.seek(0)
+        return path, dlfile
 
     # TODO: trackdown calls to dl_save and make sure file is closed.
     def dl_save(self, url, ext=None, now=None):
@@ -336,19 +545,96 @@ class ExtractBase(object):
             now = not prefs['extract.save.defer']
 
         if now is True:
-            path = self._dl_file(url, ext)
-        else:
-            path = None
-
-        if path is not None:
-            dlfile = self._open_dl_file(path)
+            with self._host_semaphore(url):
+                path, dlfile = self._dl_file(url, ext)
         else:
-            dlfile = None
+            path, dlfile = None, None
 
         # TODO: need to handle bad urls probably around here.
         urlpath = urlpath_join(url, path)
         return urlpath, dlfile
 
+    def _get_pool(self):
+        """Thread pool used for downloads, created on first use."""
+        if self._pool is None:
+            self._pool = ThreadPool(self.max_workers)
+        return self._pool
+
+    def close_pool(self, terminate=False):
+        """Shut down the download thread pool if it was created.  A new pool
+        is created if downloads are started again.
+
+        Args:
+            terminate (optional): True to stop queued downloads instead of
+                waiting for them to finish.
+        """
+        pool = self._pool
+        if pool is None:
+            return
+        self._pool = None
+
+        if terminate:
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+
+    def dl_save_async(self, url, ext=None, now=None):
+        """Call dl_save from the download thread pool.
+
+        Args:
+            url: string (must include http://)
+            ext (optional): string extension.  If not set the extension will
+                try to be determined by _req_ext.
+            now (optional): True to download now.  If not set now will be
+                set based on preferences.
+
+        Returns:
+            AsyncResult, get() returns the dl_save tuple of (urlpath, file or
+            None) or raises any exception dl_save raised.
+        """
+        return self._get_pool().apply_async(self.dl_save, (url, ext, now))
+
+    def prefetch(self, urls, ext=None, now=None):
+        """Generator calling dl_save_async for each url while keeping at most
+        max_workers * prefetch_slots downloads queued ahead of the caller.
+
+        Args:
+            urls: iterable of url strings (must include http://)
+            ext (optional): string extension used for all urls.
+            now (optional): True to download now.  If not set now will be
+                set based on preferences.
+
+        Yields:
+            AsyncResult from dl_save_async for each url in order.
+        """
+        slots = self.max_workers * self.prefetch_slots
+        pending = collections.deque()
+
+        for url in urls:
+            pending.append(self.dl_save_async(url, ext, now))
+            if len(pending) > slots:
+                yield pending.popleft()
+
+        while len(pending) != 0:
+            yield pending.popleft()
+
+    def dl_many(self, urls, ext=None, now=None):
+        """Defer or download and save many files using the download pool.
+        Downloads to the same host share pooled keep-alive connections and
+        at most MAX_HOST_DOWNLOADS run at once per host.
+
+        Args:
+            urls: iterable of url strings (must include http://)
+            ext (optional): string extension used for all urls.
+            now (optional): True to download now.  If not set now will be
+                set based on preferences.
+
+        Returns:
+            list of dl_save tuples of (urlpath, file or None) in url order.
+        """
+        return [x.get() for x in self.prefetch(urls, ext, now)]
+
     def get_file(self, urlpath):
         """Get file in urlpath.  If path part of urlpath is unset it will be
         downloaded immediately.
@@ -370,7 +656,7 @@ class ExtractBase(object):
             raise ValueError('url and path are None')
 
         if path is not None:
-            dlfile = self._open_dl_file(path, 'r')
+            dlfile = self._open_dl_file(path)
             if dlfile is None:
                 err = 'could not open: \'{}\', trying to download again'
                 log.warn(err.format(path))
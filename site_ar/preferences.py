@@ -18,6 +18,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import functools
 import logging
 
 
@@ -30,6 +31,16 @@ from .exceptions import  PreferencesError, PreferencesKeyError, \
 log = logging.getLogger(__name__)
 
 
+# Exact result type of common value_type converters.  Values already of that
+# type are returned by convert as is.
+_VALUE_TYPE_RESULT = {
+    util.boolstr: bool,
+    int: int,
+    float: float,
+    str: str,
+}
+
+
 def add_prefs_schema_up(db):
     """Preferences key,value schema up template."""
     db.add_table(
@@ -69,8 +80,10 @@ class PrefStore(object):
         self.user_data = user_data
         self.help = help
 
-        self._value = None
-        self.value = value
+        self._value = value
+        # Only preferences with a callback are notified of the initial value.
+        if on_change is not None:
+            on_change(self, value, user_data)
 
     def __str__(self):
         return ('PrefStore(key={} value_type={} required={} default={} '
@@ -84,8 +97,12 @@ class PrefStore(object):
 
     @value.setter
     def value(self, value):
+        self.set_value(value)
+
+    def set_value(self, value):
+        """Set value and notify on_change if set.  Used by Preferences to
+        skip the property indirection."""
         self._value = value
-        # Notify on_change if set.
         if self.on_change is not None:
             self.on_change(self, value, self.user_data)
 
@@ -101,6 +118,10 @@ class Preferences(object):
         self.loaded = False
         self.data = {}
         self.db = db
+        # Cached result of keys(), reset when a preference is added.
+        self._keys = None
+        # Cached validator functions by lower case key.
+        self._validators = {}
 
     def __getitem__(self, item):
         return self.get(item)
@@ -109,10 +130,11 @@ class Preferences(object):
         return self.set(item, value)
 
     def _check_key(self, key):
-        if key.lower() not in self.data.keys():
+        lkey = key.lower()
+        if lkey not in self.data:
             raise PreferencesKeyError('preferences key {} does not exist'.
                     format(key))
-        return key.lower()
+        return lkey
 
     def set_db(self, db):
         """Set DBDriver object."""
@@ -123,32 +145,36 @@ class Preferences(object):
         values from the database.  The two except blocks below are non-fatal
         as they could be due to code changes and we don't want to crash.
         """
-        try:
-            # Use set to do type checking.
-            self.set(key, value)
-            # set will mark this data as dirty but it really is clean.
-            self.data[key.lower()].dirty = False
-        except PreferencesKeyError:
+        pref = self.data.get(key.lower())
+        if pref is None:
             # A preference was removed or has not been loaded yet,
             # preferences table may need a cleaning.
             log.info('key {} found in database but not in '
                     'preferences'.format(key))
+            return
+
+        try:
+            value = self.convert(pref, value)
         except PreferencesTypeError:
             # A preference type has changed so reset back to the default.
-            pref = self.data[key.lower()]
             type_name = getattr(pref.value_type, '__name__',
                     repr(pref.value_type))
             log.warn('invalid value \'{}\' for key {} of type {}'.format(
                     value, key, type_name))
             log.warn('setting default for key {}'.format(key))
-            pref.value = pref.default
-            pref.dirty = False
+            value = pref.default
+
+        # Only assign on change so on_change is not called for values that
+        # match the default.
+        if pref.value != value:
+            pref.set_value(value)
+        # Loaded data is clean.
+        pref.dirty = False
 
     def _load_key(self, key):
         """Load key from database into preferences."""
-        sql = 'SELECT * FROM preferences WHERE key=\'{}\''.format(
-                key.lower())
-        db_data = self.db.execall(sql)
+        sql = 'SELECT * FROM preferences WHERE key=?'
+        db_data = self.db.execall(sql, (key.lower(),))
 
         if len(db_data) != 0:
             key, value = db_data[0]
@@ -173,6 +199,21 @@ class Preferences(object):
         Returns:
             None.
         """
+        value_type, default = self._check_add(key, value_type, required,
+                default)
+        self._add(key, value_type, required, default, on_change=on_change,
+                user_data=user_data, help=help)
+
+    def _check_add(self, key, value_type, required, default=UNSET,
+            on_change=None, user_data=None, help=None):
+        """Check add arguments without adding the preference.
+
+        Args:
+            See add.
+
+        Returns:
+            tuple of (value_type, default) converted for _add.
+        """
         if not callable(value_type):
             raise PreferencesError('value_type must be callable')
         elif value_type is bool:
@@ -181,7 +222,7 @@ class Preferences(object):
         if required and default is UNSET:
             raise PreferencesError('required preferences must have a default')
 
-        if key.lower() in self.data.keys():
+        if key.lower() in self.data:
             msg = 'duplicate (case insensitive) key {}'.format(key)
             raise PreferencesError(msg)
 
@@ -195,10 +236,16 @@ class Preferences(object):
                         'invalid default value \'{}\' for type {}'.format(
                         default, type_name))
 
+        return value_type, default
+
+    def _add(self, key, value_type, required, default, on_change=None,
+            user_data=None, help=None):
+        """Add preference definition checked by _check_add, see add."""
         self.data[key.lower()] = PrefStore(key=key, value_type=value_type,
                 required=required, default=default, value=default,
                 dirty=True, on_change=on_change, user_data=user_data,
                 help=help)
+        self._keys = None
 
         # If preferences are added after the database ia loaded check for
         # an existing value.  This could happen if 'on demand' imports are
@@ -206,9 +253,40 @@ class Preferences(object):
         if self.loaded:
             self._load_key(key)
 
+    def add_many(self, schema):
+        """Add several preference definitions into manager.  Every definition
+        is checked before any are added so a bad schema adds nothing.
+
+        Args:
+            schema: iterable of dicts of add keyword arguments.
+
+        Returns:
+            None.
+        """
+        checked = []
+        lkeys = set()
+        for kwargs in schema:
+            lkey = kwargs['key'].lower()
+            if lkey in lkeys:
+                msg = 'duplicate (case insensitive) key {}'.format(
+                        kwargs['key'])
+                raise PreferencesError(msg)
+            lkeys.add(lkey)
+
+            kwargs = dict(kwargs)
+            kwargs['value_type'], kwargs['default'] = self._check_add(
+                    **kwargs)
+            checked.append(kwargs)
+
+        for kwargs in checked:
+            self._add(**kwargs)
+
     def keys(self):
-        """List of case-insensitive unique key strings."""
-        return [x.key for x in self.data.itervalues()]
+        """Sorted list of case-insensitive unique key strings.  The list is
+        cached until a preference is added and must not be modified."""
+        if self._keys is None:
+            self._keys = sorted(x.key for x in self.data.values())
+        return self._keys
 
     def prefs(self):
         """List of preference key, value pairs."""
@@ -216,8 +294,7 @@ class Preferences(object):
 
     def iterprefs(self):
         """Iterator for prefs."""
-        prefiter = self.data.itervalues()
-        for pref in prefiter:
+        for pref in self.data.values():
             yield (pref.key, pref.value)
 
     def get_pref(self, key):
@@ -248,6 +325,10 @@ class Preferences(object):
             raise PreferencesTypeError(
                     'preference {} must have a value'.format(pref.key))
 
+        # Exact type check, bool is a subclass of int.
+        if type(value) is _VALUE_TYPE_RESULT.get(pref.value_type):
+            return value
+
         if value is not UNSET:
             try:
                 value = pref.value_type(value)
@@ -260,6 +341,24 @@ class Preferences(object):
 
         return value
 
+    def validator(self, key):
+        """Function converting and validating a value for a preference, see
+        convert.  Functions are cached per key.
+
+        Args:
+            key: key string.
+
+        Returns:
+            function taking a value argument.
+        """
+        lkey = self._check_key(key)
+        validator = self._validators.get(lkey)
+        if validator is None:
+            # Bind the PrefStore so calls skip the key lookup.
+            validator = functools.partial(self.convert, self.data[lkey])
+            self._validators[lkey] = validator
+        return validator
+
     def set(self, key, value):
         """Set perference value by key."""
         log.debug('set called on {} with {}({})'.format(key,
@@ -273,7 +372,7 @@ class Preferences(object):
 
         # avoid unnecessary writes to db.
         if pref.value != value:
-            pref.value = value
+            pref.set_value(value)
             pref.dirty = True
 
         return value
@@ -283,26 +382,29 @@ class Preferences(object):
         key = self._check_key(key)
         pref = self.data[key]
         if pref.value != pref.default:
-            pref.value = pref.default
+            pref.set_value(pref.default)
             pref.dirty = True
         return pref.default
 
     def load(self):
         """Load all preferences from database."""
         sql = 'SELECT * FROM preferences'
-        db_data = self.db.execall(sql)
+        db_data = dict(self.db.execall(sql))
 
-        for key, value in db_data:
-            self._load_key_value(key, value)
-
-        # All loaded preferences are now marked as clean from _load_key_value.
-
-        # Any preference that have a value of UNSET should be marked as
-        # clean since it must not have an entry in the database.
-        for pref in self.data.itervalues():
-            if pref.value is UNSET:
+        for pref in self.data.values():
+            value = db_data.pop(pref.key.lower(), UNSET)
+            if value is not UNSET:
+                # Marked as clean by _load_key_value.
+                self._load_key_value(pref.key, value)
+            elif pref.value is UNSET:
+                # Any preference that have a value of UNSET should be marked
+                # as clean since it must not have an entry in the database.
                 pref.dirty = False
 
+        # Remaining keys have no preference and are only logged.
+        for key, value in db_data.items():
+            self._load_key_value(key, value)
+
         self.loaded = True
 
     def save(self, key=None):
@@ -310,31 +412,43 @@ class Preferences(object):
         in place.
 
         Args:
-            key (optional): key string to save.  If omitted all preferences
-                will be saved.
+            key (optional): key string to save.  If omitted all dirty
+                preferences will be saved.
         """
         if key is not None:
             key = self._check_key(key)
-            keys = (key,)
+            prefs = (self.data[key],)
         else:
-            keys = self.data.keys()
+            prefs = [x for x in self.data.values() if x.dirty]
 
-        for key in keys:
-            value = self.data[key].value
-            if value is not UNSET:
-                sql = ('INSERT OR REPLACE INTO preferences (key, value) '
-                        'VALUES (\'{}\', \'{}\');')
-                self.db.execute(sql.format(key, value))
+        upsert = []
+        delete = []
+        for pref in prefs:
+            if pref.value is not UNSET:
+                upsert.append((pref.key.lower(), '{}'.format(pref.value)))
             else:
-                sql = 'DELETE FROM preferences WHERE key = \'{}\';'
-                self.db.execute(sql.format(key))
+                delete.append((pref.key.lower(),))
 
+        # The connection is in autocommit mode, group all statements into a
+        # single transaction.
+        self.db.execute('BEGIN')
+        try:
+            if len(upsert) != 0:
+                sql = ('INSERT OR REPLACE INTO preferences (key, value) '
+                        'VALUES (?, ?);')
+                self.db.executemany(sql, upsert)
+            if len(delete) != 0:
+                sql = 'DELETE FROM preferences WHERE key = ?;'
+                self.db.executemany(sql, delete)
+        except:
+            self.db.execute('ROLLBACK')
+            raise
         self.db.commit()
 
-        for pref in self.data.itervalues():
+        for pref in prefs:
             pref.dirty = False
 
     def dump(self):
         """Dump all preferences to log."""
-        for pref in self.data.itervalues():
+        for pref in self.data.values():
             log.debug(pref)
@@ -18,8 +18,9 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import collections
+import itertools
 import logging
+import operator
 import select
 import unicodedata
 import urwid
@@ -41,10 +42,39 @@ FIXED_LEFT = ' '.join([urwid.FIXED, urwid.LEFT])
 FIXED_RIGHT = ' '.join([urwid.FIXED, urwid.RIGHT])
 FIXED_TOP = ' '.join([urwid.FIXED, urwid.TOP])
 
+HEAVY_TLCORNER = unicodedata.lookup('BOX DRAWINGS HEAVY DOWN AND RIGHT')
+HEAVY_TRCORNER = unicodedata.lookup('BOX DRAWINGS HEAVY DOWN AND LEFT')
+HEAVY_BLCORNER = unicodedata.lookup('BOX DRAWINGS HEAVY UP AND RIGHT')
+HEAVY_BRCORNER = unicodedata.lookup('BOX DRAWINGS HEAVY UP AND LEFT')
+HEAVY_HLINE = unicodedata.lookup('BOX DRAWINGS HEAVY HORIZONTAL')
+HEAVY_VLINE = unicodedata.lookup('BOX DRAWINGS HEAVY VERTICAL')
+
+
+# Current values of preferences read on every WeakRefParentNode creation,
+# kept up to date by _pref_track_on_change.
+_pref_values = {}
+
+
+def _pref_track_on_change(pref, value, user_data):
+    """Callback storing preference value in _pref_values[user_data]."""
+    _pref_values[user_data] = value
+
 
 prefs.add('ui.weakchildren_lifespan', int, True, default=10,
+        on_change=_pref_track_on_change, user_data='lifespan',
         help='Time in seconds for children of WeakRefParentNode to '
         'maintain strong references after collapse')
+prefs.add('ui.weakchildren_maxsize', int, True, default=256,
+        on_change=_pref_track_on_change, user_data='maxsize',
+        help='Max children of a collapsed WeakRefParentNode to keep strongly '
+        'referenced for ui.weakchildren_lifespan.  Larger nodes change to '
+        'weak references on collapse.  0 for no limit')
+
+
+# Memoized _given_val results keyed by arguments, cleared when full.  Layout
+# code asks for the same dimensions and screen size on every resize.
+_given_val_cache = {}
+_GIVEN_VAL_CACHE_MAX = 2048
 
 
 def _given_val(val_type, val, screen_val):
@@ -58,6 +88,24 @@ def _given_val(val_type, val, screen_val):
     Returns:
         int dimension.
     """
+    key = (val_type, val, screen_val)
+    try:
+        return _given_val_cache[key]
+    except KeyError:
+        pass
+    except TypeError:
+        # Unhashable val, compute without caching.
+        return _calc_given_val(val_type, val, screen_val)
+
+    ret = _calc_given_val(val_type, val, screen_val)
+    if len(_given_val_cache) >= _GIVEN_VAL_CACHE_MAX:
+        _given_val_cache.clear()
+    _given_val_cache[key] = ret
+    return ret
+
+
+def _calc_given_val(val_type, val, screen_val):
+    """Uncached _given_val."""
     if val_type == 'height':
         norm_func = urwid.decoration.normalize_height
     elif val_type == 'width':
@@ -146,6 +194,79 @@ def min_width(width_a, width_b, screen_cols):
     return _min_val('width', width_a, width_b, screen_cols)
 
 
+# Flattened markup by _markup_key, cleared when full.  Only the immutable
+# decomposed markup is shared, every call still builds its own widgets since
+# callers may modify them or place the same markup in a ListBox twice.
+_text_cache = {}
+_TEXT_CACHE_MAX = 512
+
+
+def _markup_key(markup):
+    """Hashable copy of urwid markup.  Lists and tuples are converted to
+    tuples tagged with their container type since a list is a sequence of
+    markup and a tuple is (attr, markup)."""
+    if isinstance(markup, list):
+        return ('L',) + tuple(_markup_key(x) for x in markup)
+    if isinstance(markup, tuple):
+        return ('T',) + tuple(_markup_key(x) for x in markup)
+    return markup
+
+
+# Shared {None: attr} mappings by attr string.
+_attr_maps = {}
+
+
+def _norm_attr(attr):
+    """Normalize attr for urwid.AttrMap.  Strings return a shared
+    {None: attr} mapping, other values are returned unchanged."""
+    if isinstance(attr, util.STRING_TYPES):
+        attr_map = _attr_maps.get(attr)
+        if attr_map is None:
+            attr_map = {None: attr}
+            _attr_maps[attr] = attr_map
+        return attr_map
+    return attr
+
+
+def _flat_markup(markup):
+    """Flatten urwid markup to a plain string or a list of (attr, text)
+    runs which urwid.Text decomposes without recursing."""
+    text, attrib = urwid.decompose_tagmarkup(markup)
+    if not attrib:
+        return text
+
+    flat = []
+    pos = 0
+    for attr, run in attrib:
+        flat.append((attr, text[pos:pos + run]))
+        pos += run
+    if pos < len(text):
+        flat.append(text[pos:])
+    return flat
+
+
+def _build_text(markup, align, wrap, layout, attr, focus_attr):
+    """Return new urwid.AttrMap wrapped urwid.Text, see markup_to_text.
+    attr and focus_attr must be normalized by _norm_attr."""
+    try:
+        key = _markup_key(markup)
+        flat = _text_cache.get(key)
+    except TypeError:
+        # Unhashable markup, skip the cache.
+        key = None
+        flat = None
+
+    if flat is None:
+        flat = _flat_markup(markup)
+        if key is not None:
+            if len(_text_cache) >= _TEXT_CACHE_MAX:
+                _text_cache.clear()
+            _text_cache[key] = flat
+
+    text = urwid.Text(flat, align=align, wrap=wrap, layout=layout)
+    return urwid.AttrMap(text, attr, focus_attr)
+
+
 def markup_to_text(markup, align=urwid.LEFT, wrap=urwid.SPACE, layout=None,
         attr='body', focus_attr=None):
     """Convert markup to urwid.Text.
@@ -161,14 +282,8 @@ def markup_to_text(markup, align=urwid.LEFT, wrap=urwid.SPACE, layout=None,
     Returns:
         urwid.Text.
     """
-    if isinstance(attr, basestring):
-        attr = {None: attr}
-    if isinstance(focus_attr, basestring):
-        focus_attr = {None: focus_attr}
-
-    text = urwid.Text(markup, align=align, wrap=wrap, layout=layout)
-    text = urwid.AttrMap(text, attr, focus_attr)
-    return text
+    return _build_text(markup, align, wrap, layout, _norm_attr(attr),
+            _norm_attr(focus_attr))
 
 
 def markup_list_to_text(markup_list, align=urwid.LEFT, wrap=urwid.SPACE,
@@ -186,18 +301,11 @@ def markup_list_to_text(markup_list, align=urwid.LEFT, wrap=urwid.SPACE,
     Returns:
         list of urwid.Text.
     """
-    if isinstance(attr, basestring):
-        attr = {None: attr}
-    if isinstance(focus_attr, basestring):
-        focus_attr = {None: focus_attr}
-
-    widgets = []
-    for markup in markup_list:
-        text = urwid.Text(markup, align=align, wrap=wrap, layout=layout)
-        text = urwid.AttrMap(text, attr, focus_attr)
-        widgets.append(text)
+    attr = _norm_attr(attr)
+    focus_attr = _norm_attr(focus_attr)
 
-    return widgets
+    return [_build_text(x, align, wrap, layout, attr, focus_attr)
+            for x in markup_list]
 
 
 def listbox_contents_iter(contents):
@@ -207,14 +315,13 @@ def listbox_contents_iter(contents):
     if type(contents).__name__ != 'ListBoxContents':
         raise TypeError('contents must be urwid.ListBox.ListBoxContents')
 
-    index = 0
-    while True:
-        item = contents[index]
+    getitem = contents.__getitem__
+    for index in itertools.count():
+        item = getitem(index)
         # ListBoxContents will return None if index is out of range.
         if item is None:
-            raise StopIteration
+            return
         yield item
-        index += 1
 
 
 def tree_attr_find(node, attr, attr_callable=False, find_first=True):
@@ -230,19 +337,22 @@ def tree_attr_find(node, attr, attr_callable=False, find_first=True):
     Returns:
         matching node or None.
     """
+    find_first = find_first is True
     found = None
-    while node != None:
+    while node is not None:
         nodeattr = getattr(node, attr, None)
         if nodeattr is not None and (attr_callable is False
                 or callable(nodeattr)):
-            if find_first is True:
+            if find_first:
                 return node
             found = node
 
-        if not hasattr(node, 'get_parent'):
+        try:
+            get_parent = node.get_parent
+        except AttributeError:
             raise ValueError('node does not have get_parent')
 
-        node = node.get_parent()
+        node = get_parent()
 
     return found
 
@@ -255,7 +365,7 @@ class WeakRefParentNode(urwid.ParentNode):
     Class requires extra support to operate."""
 
     def __init__(self, loop, value, parent=None, key=None, depth=None,
-            lifespan=None):
+            lifespan=None, maxsize=None):
         """Initializer.
 
         Args:
@@ -268,22 +378,30 @@ class WeakRefParentNode(urwid.ParentNode):
                 referenced on collapse.  If 0 children will always be strongly
                 referenced.  If > 0 time in seconds after collapse children
                 change to weak referenced.
+            maxsize (optional): int max children kept strongly referenced
+                during lifespan after collapse, 0 for no limit.  Nodes with
+                more children change to weak referenced on collapse.
         """
         if lifespan is None:
-            lifespan = prefs['ui.weakchildren_lifespan']
+            lifespan = _pref_values['lifespan']
+        if maxsize is None:
+            maxsize = _pref_values['maxsize']
 
         self.loop = loop
         self.lifespan = lifespan
+        self.maxsize = maxsize
         self.alarm = None
 
         super(WeakRefParentNode, self).__init__(value, parent=parent,
                 key=key, depth=depth)
 
-        log.debug('_children type: {}'.format(type(self._children).__name__))
+        log.debug('_children type: %s', type(self._children).__name__)
         if len(self._children):
             raise ValueError('unexpected data in self._children')
 
         self._children = weakref.WeakValueDictionary()
+        # Tracks the type of _children to avoid isinstance checks.
+        self._strong_children = False
         self._expanded_count = 0
 
     def _set_alarm(self, sec):
@@ -291,7 +409,7 @@ class WeakRefParentNode(urwid.ParentNode):
         if self.alarm is not None:
             self._clear_alarm()
 
-        log.debug('setting alarm in {} seconds'.format(sec))
+        log.debug('setting alarm in %s seconds', sec)
         self.alarm = self.loop.set_alarm_in(sec, self.on_alarm)
 
     def _clear_alarm(self):
@@ -299,33 +417,35 @@ class WeakRefParentNode(urwid.ParentNode):
         if self.alarm is None:
             return
 
-        log.debug('clearing alarm {}'.format(self.alarm))
+        log.debug('clearing alarm %s', self.alarm)
         ret = self.loop.remove_alarm(self.alarm)
         if ret is False:
-            log.warn('alarm {} not found'.format(self.alarm))
+            log.warn('alarm %s not found', self.alarm)
         self.alarm = None
 
     def _set_strong_children(self):
         """Set children to strongly referenced."""
-        if not isinstance(self._children, dict):
+        if not self._strong_children:
             self._children = dict(self._children)
-            log.debug('recovered {} weak children'.format(len(self._children)))
+            self._strong_children = True
+            log.debug('recovered %d weak children', len(self._children))
 
     def _set_weak_children(self):
         """Set children to weak referenced."""
-        if not isinstance(self._children, weakref.WeakValueDictionary):
-            log.debug('save {} weak children'.format(len(self._children)))
+        if self._strong_children:
+            log.debug('save %d weak children', len(self._children))
             self._children = weakref.WeakValueDictionary(self._children)
-            log.debug('{} children now weak'.format(len(self._children)))
+            self._strong_children = False
+            log.debug('%d children now weak', len(self._children))
 
     def _assert_strong_children(self):
         """Raise TypeError if children are not strongly referenced."""
-        if not isinstance(self._children, dict):
+        if not self._strong_children:
             raise TypeError('self._children must be type dict')
 
     def on_alarm(self, loop, user_data):
         """Alarm to change children to weak referenced."""
-        log.debug('alarm fired on {}'.format(self))
+        log.debug('alarm fired on %s', self)
         self.alarm = None
         self._set_weak_children()
 
@@ -333,9 +453,10 @@ class WeakRefParentNode(urwid.ParentNode):
         """on_expand event to change children to strongly referenced.
         on_expand will increase an internal counter so multiple users may
         expand the node to use the children."""
-        log.info('on_expand on parent {} with {} children in {} '
-                'count {}'.format(hex(id(self)), len(self._children),
-                type(self._children).__name__, self._expanded_count))
+        if log.isEnabledFor(logging.INFO):
+            log.info('on_expand on parent %#x with %d children in %s '
+                    'count %d', id(self), len(self._children),
+                    type(self._children).__name__, self._expanded_count)
 
         self._expanded_count += 1
         self._clear_alarm()
@@ -345,9 +466,10 @@ class WeakRefParentNode(urwid.ParentNode):
         """on_expand event to decrease the internal counter.  If counter
         reaches 0 children will be changed to weak referenced or alarm set
         based on __init__ lifespan argument."""
-        log.info('on_collapse on parent {} with {} children in {} '
-                'count {}'.format(hex(id(self)), len(self._children),
-                type(self._children).__name__, self._expanded_count))
+        if log.isEnabledFor(logging.INFO):
+            log.info('on_collapse on parent %#x with %d children in %s '
+                    'count %d', id(self), len(self._children),
+                    type(self._children).__name__, self._expanded_count)
 
         if self._expanded_count == 0:
             log.warn('on_collapse called without matching expand')
@@ -361,13 +483,17 @@ class WeakRefParentNode(urwid.ParentNode):
             # Set to weak immediately if there are no children (covers empty
             #parent or new parent where children have not been loaded yet).
             #Need to make sure _children is weak when collapsed if sources
-            #other than TreeWalker are going to load children
-            if not len(self._children):
+            #other than TreeWalker are going to load children.  Large
+            #parents also change immediately to bound memory held by
+            #collapsed nodes.
+            count = len(self._children)
+            if not count or 0 < self.maxsize < count:
                 self._set_weak_children()
             else:
                 self._set_alarm(self.lifespan)
         elif self.lifespan == 0:
             self._children = weakref.WeakValueDictionary()
+            self._strong_children = False
 
     def get_child_node(self, key, reload=False):
         """get_child_node ensuring children are strongly referenced."""
@@ -385,10 +511,24 @@ class WeakRefParentNode(urwid.ParentNode):
         return super(WeakRefParentNode, self).change_child_key(oldkey, newkey)
 
 
-class SiblingList(list):
+class SiblingList(object):
     """Unique class to store sibling data for lists of top level nodes with no
-    parent.  Each entry SiblingLists are {'data': value, 'node': node}."""
-    pass
+    parent.  Sibling values and their cached nodes are kept in the parallel
+    lists data and nodes."""
+
+    __slots__ = ('data', 'nodes')
+
+    def __init__(self, values):
+        """Initializer.
+
+        Args:
+            values: iterable of sibling values.
+        """
+        self.data = list(values)
+        self.nodes = [None] * len(self.data)
+
+    def __len__(self):
+        return len(self.data)
 
 
 class TreeRootNodeListMixin(object):
@@ -403,13 +543,12 @@ class TreeRootNodeListMixin(object):
             SiblingList, key
         """
         if not isinstance(value_list, SiblingList):
-            value_list = SiblingList([{'data': x, 'node': None} for x
-                    in value_list])
+            value_list = SiblingList(value_list)
 
         # Bootstrap key and node if this is the first node in value_list.
         if key is None:
             key = 0
-            value_list[0]['node'] = self
+            value_list.nodes[0] = self
 
         return value_list, key
 
@@ -428,25 +567,45 @@ class TreeRootNodeListMixin(object):
             key (optional): sibling key, if omitted gets self as sibling.
 
         Returns:
-            sibling as {'data': value, 'node': node}.
+            sibling as tuple of (value, node).
         """
         if key is None:
             key = self.get_key()
-        return self.get_value()[key]
+        siblings = self.get_value()
+        return siblings.data[key], siblings.nodes[key]
 
     def get_sibling_data(self, key=None):
         """Get sibling data by key.  If key is omitted returns self data."""
-        return self.get_sibling(key)['data']
+        if key is None:
+            key = self.get_key()
+        return self.get_value().data[key]
 
-    def get_sibling_node(self, key=None):
-        """Get sibling node by key.  If key is omitted returns self node."""
+    def _sibling_node(self, key, create):
+        """Get cached sibling node by key, creating it if needed.
+
+        Args:
+            key: sibling key, if None gets self as sibling.
+            create: callable taking (SiblingList, key) returning a new node.
+
+        Returns:
+            sibling node.
+        """
         # Only children nodes get cached by the parent.  TreeRootNodeList have
         # no parent so we need to create the cache of siblings or they will
         # be regenerated and settings lost (i.e. exanded/collapsed).
-        sibling = self.get_sibling(key)
-        if sibling['node'] is None:
-            sibling['node'] = TreeRootNodeList(self.get_value_list(), key=key)
-        return sibling['node']
+        if key is None:
+            key = self.get_key()
+        siblings = self.get_value()
+        node = siblings.nodes[key]
+        if node is None:
+            node = create(siblings, key)
+            siblings.nodes[key] = node
+        return node
+
+    def get_sibling_node(self, key=None):
+        """Get sibling node by key.  If key is omitted returns self node."""
+        return self._sibling_node(key,
+                lambda siblings, key: TreeRootNodeList(siblings, key=key))
 
     def next_sibling(self):
         """Return next sibling in order or None if at end of list."""
@@ -511,14 +670,32 @@ class RowDOChildrenExportMixin(object):
     pre_cache_func = 'on_expand'
     post_cache_func = 'on_collapse'
 
+    # Unbound cache functions by (class, attribute name).  Bound methods are
+    # not kept, stored on the node they would form a reference cycle keeping
+    # it and its children alive.
+    _cache_methods = {}
+
     def _call_cache_func(self, func):
         """Call cache function.
 
         Args:
-            func: function or string of attribute on self.
+            func: function or string of method name on the node class.
         """
-        if isinstance(func, basestring):
-            func = getattr(self, func, None)
+        if isinstance(func, util.STRING_TYPES):
+            key = (type(self), func)
+            try:
+                method = self._cache_methods[key]
+            except KeyError:
+                method = getattr(type(self), func, None)
+                if method is not None and not callable(method):
+                    raise ValueError('invalid cache function: {}'.format(
+                            method))
+                self._cache_methods[key] = method
+
+            if method is not None:
+                method(self)
+            return
+
         if func is None:
             return
 
@@ -580,29 +757,35 @@ class RowDOChildrenExportMixin(object):
         if use_cache is True:
             self._pre_cache()
 
-        child_keys = self.get_child_keys()
+        # Resolve lookups once outside of the per child loop.
+        RowDO = dbdrv.RowDO
+        write_row = exporter.write_row
+        if use_cache is True:
+            get_child_node = self.get_child_node
+            child_mapping = operator.methodcaller(get_child_mapping)
+            load_rdo = lambda child_key: child_mapping(
+                    get_child_node(child_key))
+        else:
+            load_rdo = getattr(self, get_keyed_mapping)
 
-        for child_key in child_keys:
-            if use_cache is True:
-                rdo = getattr(self.get_child_node(child_key),
-                        get_child_mapping)()
-            else:
-                rdo = getattr(self, get_keyed_mapping)(child_key)
+        try:
+            for child_key in self.get_child_keys():
+                rdo = load_rdo(child_key)
+
+                if not isinstance(rdo, RowDO):
+                    err = 'could not load rdo for child key: {}'.format(
+                            child_key)
+                    log.warn(err)
+                    continue
 
-            if not isinstance(rdo, dbdrv.RowDO):
-                err = 'could not load rdo for child key: {}'.format(
-                        child_key)
-                log.warn(err)
-            else:
                 if rdo_callback is not None:
                     # Make a copy to leave the search results unchanged by
                     # the callback.
-                    rdo = rdo_callback(dbdrv.RowDO(rdo), rdo)
-                values = rdo.values(keys)
-                exporter.write_row(values)
-
-        if use_cache is True:
-            self._post_cache()
+                    rdo = rdo_callback(RowDO(rdo), rdo)
+                write_row(rdo.values(keys))
+        finally:
+            if use_cache is True:
+                self._post_cache()
 
 
 class HeavyLineBox(urwid.LineBox):
@@ -612,14 +795,14 @@ class HeavyLineBox(urwid.LineBox):
             self,
             original_widget,
             title='',
-            tlcorner=unicodedata.lookup('BOX DRAWINGS HEAVY DOWN AND RIGHT'),
-            tline=unicodedata.lookup('BOX DRAWINGS HEAVY HORIZONTAL'),
-            lline=unicodedata.lookup('BOX DRAWINGS HEAVY VERTICAL'),
-            trcorner=unicodedata.lookup('BOX DRAWINGS HEAVY DOWN AND LEFT'),
-            blcorner=unicodedata.lookup('BOX DRAWINGS HEAVY UP AND RIGHT'),
-            rline=unicodedata.lookup('BOX DRAWINGS HEAVY VERTICAL'),
-            bline=unicodedata.lookup('BOX DRAWINGS HEAVY HORIZONTAL'),
-            brcorner=unicodedata.lookup('BOX DRAWINGS HEAVY UP AND LEFT')):
+            tlcorner=HEAVY_TLCORNER,
+            tline=HEAVY_HLINE,
+            lline=HEAVY_VLINE,
+            trcorner=HEAVY_TRCORNER,
+            blcorner=HEAVY_BLCORNER,
+            rline=HEAVY_VLINE,
+            bline=HEAVY_HLINE,
+            brcorner=HEAVY_BRCORNER):
         super(HeavyLineBox, self).__init__(original_widget, title, tlcorner,
                 tline, lline, trcorner, blcorner, rline, bline, brcorner)
 
@@ -652,6 +835,8 @@ class IteratorWalker(urwid.ListWalker):
         self.iterator = iterator
         self.contents = []
         self.position = 0
+        # Set once iterator is exhausted so it is not polled again.
+        self._drained = False
 
     def _get(self, position):
         """Gets a value by positiion from iterator or contents if already
@@ -667,14 +852,12 @@ class IteratorWalker(urwid.ListWalker):
         if position < 0:
             return None, None
 
-        count = len(self.contents)
-
-        while count <= position:
-            try:
-                self.contents.append(self.iterator.next())
-            except StopIteration:
-                break
-            count += 1
+        contents = self.contents
+        need = position + 1 - len(contents)
+        if need > 0 and not self._drained:
+            contents.extend(itertools.islice(self.iterator, need))
+            if len(contents) <= position:
+                self._drained = True
 
         try:
             return self.contents[position], position
@@ -719,19 +902,17 @@ class IteratorWalker(urwid.ListWalker):
         return self._get(position - 1)
 
 
-_listboxbase_cmd_map = urwid.command_map.copy()
-_listboxbase_cmd_map._command.update({
+_listboxbase_cmds = {
     'k':        urwid.CURSOR_UP,
     'K':        urwid.CURSOR_UP,
     'j':        urwid.CURSOR_DOWN,
     'J':        urwid.CURSOR_DOWN,
     'ctrl d':   urwid.CURSOR_PAGE_DOWN,
     'ctrl u':   urwid.CURSOR_PAGE_UP
-})
+}
 
 
-_treelistboxbase_cmd_map = _listboxbase_cmd_map.copy()
-_treelistboxbase_cmd_map._command.update({
+_treelistboxbase_cmds = {
     'h':        urwid.CURSOR_LEFT,
     'H':        urwid.CURSOR_LEFT,
     '-':        urwid.CURSOR_LEFT,
@@ -739,7 +920,30 @@ _treelistboxbase_cmd_map._command.update({
     'L':        urwid.CURSOR_RIGHT,
     '=':        urwid.CURSOR_RIGHT,
     '+':        urwid.CURSOR_RIGHT
-})
+}
+
+
+class _LazyCommandMap(object):
+    """Class attribute descriptor building a copy of urwid.command_map
+    updated with each commands dict on first access.  Instances may still
+    assign their own _command_map."""
+
+    def __init__(self, *commands):
+        """Initializer.
+
+        Args:
+            *commands: dicts of key to urwid command applied in order.
+        """
+        self.commands = commands
+        self.cmd_map = None
+
+    def __get__(self, obj, objtype=None):
+        if self.cmd_map is None:
+            cmd_map = urwid.command_map.copy()
+            for commands in self.commands:
+                cmd_map._command.update(commands)
+            self.cmd_map = cmd_map
+        return self.cmd_map
 
 
 class ListBoxBase(urwid.ListBox):
@@ -747,14 +951,16 @@ class ListBoxBase(urwid.ListBox):
     and 'ctrl-u' movement key functionality.  Can also support a body
     generated by an iterator by default."""
 
-    _command_map = _listboxbase_cmd_map
+    _command_map = _LazyCommandMap(_listboxbase_cmds)
 
     def __init__(self, body):
         # ListBox expects body to have the attribute get_focus.  If not it
         # will use a default ListWalker which then expects body to have
         # __getitem__.  In the case of an iterator use the ItertorWalker.
+        # Iterators are duck-typed (next on Python 2, __next__ on Python 3)
+        # since collections.Iterator moved to collections.abc.
         if not getattr(body, 'get_focus', None) \
-                and isinstance(body, collections.Iterator):
+                and (hasattr(body, '__next__') or hasattr(body, 'next')):
             body = IteratorWalker(body)
 
         super(ListBoxBase, self).__init__(body)
@@ -764,7 +970,13 @@ class TreeListBoxBase(urwid.TreeListBox):
     """Simple child class of urwid.TreeListBox that adds 'h', 'j', 'k', 'l',
     'ctrl-d' and 'ctrl-u' movement key functionality."""
 
-    _command_map = _treelistboxbase_cmd_map
+    _command_map = _LazyCommandMap(_listboxbase_cmds, _treelistboxbase_cmds)
+
+    # Command to keypress handler method name.
+    _keypress_dispatch = {
+        urwid.CURSOR_LEFT:  '_keypress_left',
+        urwid.CURSOR_RIGHT: '_keypress_right',
+    }
 
     def _keypress_left(self, size):
         tree_widget, _ = self.get_focus()
@@ -783,10 +995,9 @@ class TreeListBoxBase(urwid.TreeListBox):
             tree_widget.update_expanded_icon()
 
     def keypress(self, size, key):
-        if self._command_map[key] == urwid.CURSOR_LEFT:
-            self._keypress_left(size)
-        elif self._command_map[key] == urwid.CURSOR_RIGHT:
-            self._keypress_right(size)
+        handler = self._keypress_dispatch.get(self._command_map[key])
+        if handler is not None:
+            getattr(self, handler)(size)
         else:
             return super(TreeListBoxBase, self).keypress(size, key)
 
@@ -797,12 +1008,15 @@ class GridFlowBase(urwid.GridFlow):
 
     # No easy way to use command map on GridFlow since cursor keys are
     # used by Columns/Pile objects dynamically allocated by GridFlow.
-    def keypress(self, size, key):
-        if key in ('h', 'H'):
-            key = 'left'
-        elif key in ('l', 'L'):
-            key = 'right'
+    _key_remap = {
+        'h':    'left',
+        'H':    'left',
+        'l':    'right',
+        'L':    'right',
+    }
 
+    def keypress(self, size, key):
+        key = self._key_remap.get(key, key)
         return super(GridFlowBase, self).keypress(size, key)
 
 
@@ -830,12 +1044,14 @@ class ValidatedEdit(urwid.Edit):
                 the edit text string.
         """
         self._last_validated = None
+        # Converted value of _last_validated.
+        self._last_value = None
         self._validator = validator
 
         # Ensure the original text is actually valid.  Do not catch
         # exceptions here.
         if self._validator is not None:
-            self._validator(edit_text)
+            self._last_value = self._validator(edit_text)
             self._last_validated = edit_text
 
         super(ValidatedEdit, self).__init__(caption=caption,
@@ -849,8 +1065,13 @@ class ValidatedEdit(urwid.Edit):
         if self._validator is None:
             return
 
+        # Text is unchanged since the last validation (i.e. focus moved
+        # through the widget without editing).
+        if self.edit_text == self._last_validated:
+            return
+
         try:
-            self._validator(self.edit_text)
+            self._last_value = self._validator(self.edit_text)
             self._last_validated = self.edit_text
         except (PreferencesTypeError, TypeError, ValueError) as e:
             log.info(util.exception_string(e))
@@ -861,12 +1082,13 @@ class ValidatedEdit(urwid.Edit):
     def value(self):
         """Perform conversion of edit text using validator.  Returns edit text
         if validator is disabled."""
-        if self._validator is not None:
-            value = self._validator(self.edit_text)
-        else:
-            value = self.edit_text
+        if self._validator is None:
+            return self.edit_text
+
+        if self.edit_text == self._last_validated:
+            return self._last_value
 
-        return value
+        return self._validator(self.edit_text)
 
     def on_focus_out(self):
         """Call backed used when focus leaves widget to call validator."""
@@ -20,19 +20,15 @@
 
 import collections
 import errno
-import functools
 import logging
-import operator
 import shlex
-import types
-import unicodedata
 import urwid
 
 
 from . import prefs
 from . import ui_base
 from . import util
-from .exceptions import UIError, PreferencesTypeError, ValidatedEditError
+from .exceptions import UIError, ValidatedEditError
 
 
 log = logging.getLogger(__name__)
@@ -42,6 +38,42 @@ DIALOG_BASE_ROWS_COLS = (7, 8)
 DIALOG_TITLE_ROWS = 2
 ERROR_DIALOG_ROWS_COLS = (9, 8)
 
+# Dividers have no per instance state so are shared by all dialog frames.
+_TITLE_DIVIDER = urwid.Divider(ui_base.HEAVY_HLINE)
+_FOOTER_DIVIDER = urwid.Divider(ui_base.HEAVY_HLINE)
+# Default style ErrorDialog title, same as DialogFrameWidget would build.
+_ERROR_TITLE = urwid.Pile([
+        urwid.AttrMap(urwid.Text('ERROR', align=urwid.CENTER), 'error'),
+        _TITLE_DIVIDER])
+
+# Attr maps shared by dialog widgets, urwid.AttrMap copies these.
+_BODY_MAP = {None: 'body'}
+_FOCUS_MAP = {None: 'focus'}
+_BORDER_MAP = {None: 'border'}
+_SHADOW_MAP = {None: 'shadow'}
+
+# Overlay decoration shared by all DialogBase instances.
+# Vertical shadow, clears space on top with the body attr.
+_V_SHADOW = urwid.AttrMap(urwid.Filler(urwid.Text(('body', '  ')), urwid.TOP),
+        _SHADOW_MAP)
+# Horizontal shadow, clears space on left with the body attr.
+_H_SHADOW = urwid.AttrMap(urwid.Text(('body', '  ')), _SHADOW_MAP)
+
+# ListBox command map used by OnFocusEditDialog, see _edit_command_map.
+_EDIT_COMMAND_MAP = None
+
+
+def _edit_command_map():
+    """Shared copy of the urwid.ListBox command map where enter moves the
+    cursor down.  Built on first use so changes made to the urwid command
+    map during startup are included."""
+    global _EDIT_COMMAND_MAP
+    if _EDIT_COMMAND_MAP is None:
+        command_map = urwid.ListBox._command_map.copy()
+        command_map['enter'] = urwid.CURSOR_DOWN
+        _EDIT_COMMAND_MAP = command_map
+    return _EDIT_COMMAND_MAP
+
 
 class DialogExit(Exception):
     """Exception used for exiting dialogs and returning a status code."""
@@ -55,6 +87,13 @@ class DialogWidgetMixin(object):
     exit_on_space = None
     # Note: Catching enter will prevent buttons from working.
     exit_on_enter = None
+    # Map of keys to the exit_on_* attribute checked for that key.  Attributes
+    # are read on keypress since they may be set after init.
+    _exit_attrs = {
+        'esc': 'exit_on_esc',
+        'enter': 'exit_on_enter',
+        ' ': 'exit_on_space',
+    }
 
     def exit(self, status=None):
         """Raise DialogExit to exit dialog and return status code."""
@@ -66,12 +105,11 @@ class DialogWidgetMixin(object):
 
     def keypress(self, size, key):
         """Catch common dialog keys based on instance variables."""
-        if self.exit_on_esc is not None and key == 'esc':
-            self.exit(self.exit_on_esc)
-        if self.exit_on_enter is not None and key == 'enter':
-            self.exit(self.exit_on_enter)
-        if self.exit_on_space is not None and key == ' ':
-            self.exit(self.exit_on_space)
+        attr = self._exit_attrs.get(key)
+        if attr is not None:
+            status = getattr(self, attr)
+            if status is not None:
+                self.exit(status)
 
         return super(DialogWidgetMixin, self).keypress(size, key)
 
@@ -93,13 +131,19 @@ class DialogWidgetMixin(object):
             urwid.Button.
         """
         # Bind unbound methods to this instance only if the method belongs
-        # to this class or parent.
-        if isinstance(callback, types.MethodType) and callback.im_self is None:
-            if issubclass(self.__class__, callback.im_class):
-                callback = callback.__get__(self, self.__class__)
-            else:
-                raise UIError('can not bind callback: {} to {}'.format(
-                        callback, self))
+        # to this class or parent.  Bound methods are kept per instance so
+        # buttons sharing a callback share the bound method.  Only unbound
+        # methods have an im_self of None.
+        if getattr(callback, 'im_self', False) is None:
+            bound_callbacks = self.__dict__.setdefault('_bound_callbacks', {})
+            bound = bound_callbacks.get(callback)
+            if bound is None:
+                if not issubclass(self.__class__, callback.im_class):
+                    raise UIError('can not bind callback: {} to {}'.format(
+                            callback, self))
+                bound = callback.__get__(self, self.__class__)
+                bound_callbacks[callback] = bound
+            callback = bound
 
         button = urwid.Button(label, callback, user_data)
         button._w = urwid.AttrMap(button._w, None)
@@ -143,13 +187,12 @@ class DialogFrameWidget(DialogWidgetMixin, urwid.Frame):
 
         self.exit_on_esc = 0
 
-        if isinstance(title, basestring):
+        if isinstance(title, util.STRING_TYPES):
             # Default style.
-            divchr = unicodedata.lookup('BOX DRAWINGS HEAVY HORIZONTAL')
             title = urwid.Text(title, align=urwid.CENTER)
             if title_attr is not None:
                 title = urwid.AttrMap(title, title_attr)
-            self._dfw_header = urwid.Pile([title, urwid.Divider(divchr)])
+            self._dfw_header = urwid.Pile([title, _TITLE_DIVIDER])
         elif title is not None:
             # Directly apply title to frame header.
             self._dfw_header = title
@@ -160,13 +203,14 @@ class DialogFrameWidget(DialogWidgetMixin, urwid.Frame):
             button_widgets = []
             focus_position = None
             for index, button_desc in enumerate(buttons):
+                desc_len = len(button_desc)
+                user_data = button_desc[2] if desc_len > 2 else None
                 button_widgets.append(self.create_button(button_desc[0],
-                        button_desc[1], util.getindex(button_desc, 2, None),
-                        'button', 'button focus'))
+                        button_desc[1], user_data, 'button', 'button focus'))
 
                 # Set default focus to first found button with default set.
-                if focus_position is None and util.getindex(button_desc, 3,
-                        False):
+                if focus_position is None and desc_len > 3 and \
+                        button_desc[3]:
                     focus_position = index
 
             # Gridflow containing buttons.
@@ -175,18 +219,27 @@ class DialogFrameWidget(DialogWidgetMixin, urwid.Frame):
 
             if focus_position is not None:
                 self._dfw_buttons.focus_position = focus_position
+            self._dfw_button_focus = self._dfw_buttons.focus_position
 
-            divchr = unicodedata.lookup('BOX DRAWINGS HEAVY HORIZONTAL')
-            self._dfw_footer = urwid.Pile([urwid.Divider(divchr),
+            self._dfw_footer = urwid.Pile([_FOOTER_DIVIDER,
                     self._dfw_buttons], focus_item=1)
 
             if button_focus:
                 focus_part = 'footer'
 
+        self._dfw_focus_part = focus_part
+
         super(DialogFrameWidget, self).__init__(self._dfw_body,
                 header=self._dfw_header, footer=self._dfw_footer,
                 focus_part=focus_part)
 
+    def reset_focus(self):
+        """Restore the initial focus part and button so the frame can be
+        shown again."""
+        if self._dfw_buttons is not None:
+            self._dfw_buttons.focus_position = self._dfw_button_focus
+        self.focus_position = self._dfw_focus_part
+
     def set_on_focus_changed(self, on_focus_changed, user_data):
         """Change on_focus_changed callback."""
         self._on_focus_changed = on_focus_changed
@@ -198,20 +251,21 @@ class DialogFrameWidget(DialogWidgetMixin, urwid.Frame):
 
     def switch_focus(self):
         """Switch focus between body and buttons."""
-        if self._dfw_footer is not None:
-            if self.focus_position == 'body':
-                self.focus_position = 'footer'
-            else:
-                self.focus_position = 'body'
+        if self._dfw_footer is None:
+            # Frame does not have footer/buttons, focus did not change.
+            return False
 
-            if self._on_focus_changed is not None:
-                self._on_focus_changed(self._user_data)
+        if self.focus_position == 'body':
+            self.focus_position = 'footer'
+        else:
+            self.focus_position = 'body'
 
-            # Let caller know focus changed.
-            return True
+        on_focus_changed = self._on_focus_changed
+        if on_focus_changed is not None:
+            on_focus_changed(self._user_data)
 
-        # Frame does not have footer/buttons, focus did not change.
-        return False
+        # Let caller know focus changed.
+        return True
 
     def keypress(self, size, key):
         """Catch tab key for switching focus."""
@@ -250,31 +304,27 @@ class DialogBase(urwid.WidgetWrap):
         if ignore_keys is None:
             ignore_keys = tuple()
         self.ignore_keys = ignore_keys
+        # Resolved once for keypress.
+        self._ignore_all = ignore_keys == 'all'
+        if self._ignore_all:
+            self._ignore_set = frozenset()
+        else:
+            self._ignore_set = frozenset(ignore_keys)
 
         # Pad area around top_w.
         top_w = urwid.Padding(top_w, (ui_base.FIXED_LEFT, 2),
                 (ui_base.FIXED_RIGHT, 2))
         top_w = urwid.Filler(top_w, (ui_base.FIXED_TOP, 1),
                 (ui_base.FIXED_BOTTOM, 1))
-        top_w = urwid.AttrMap(top_w, {None: 'body'})
+        top_w = urwid.AttrMap(top_w, _BODY_MAP)
 
         # Create box around the overlay.
         top_w = ui_base.HeavyLineBox(top_w)
-        top_w = urwid.AttrMap(top_w, {None: 'border'})
-
-        # Clear space on top of vertical shadow.
-        v_shadow = urwid.Filler(urwid.Text(('body', '  ')), urwid.TOP)
-        # Use attr map to create vertical shadow.
-        v_shadow = urwid.AttrMap(v_shadow, {None: 'shadow'})
-        # Apply to widget.
-        top_w = urwid.Columns([top_w, (urwid.FIXED, 2, v_shadow)])
-
-        # Clear space on left of horizontal shadow.
-        h_shadow = urwid.Text(('body', '  '))
-        # Use attr map to create horizontal shadow.
-        h_shadow = urwid.AttrMap(h_shadow, {None: 'shadow'})
-        # Apply to widget.
-        top_w = urwid.Frame(top_w, footer=h_shadow)
+        top_w = urwid.AttrMap(top_w, _BORDER_MAP)
+
+        # Apply shadows to widget.
+        top_w = urwid.Columns([top_w, (urwid.FIXED, 2, _V_SHADOW)])
+        top_w = urwid.Frame(top_w, footer=_H_SHADOW)
 
         self.overlay = urwid.Overlay(top_w, bottom_w, urwid.CENTER, width,
                 urwid.MIDDLE, height)
@@ -295,14 +345,9 @@ class DialogBase(urwid.WidgetWrap):
         # or buttons.
         key = super(DialogBase, self).keypress(size, key)
 
-        # Next check for specific ignored keys.
-        if isinstance(self.ignore_keys, (tuple, list)) \
-                and key in self.ignore_keys:
-            return None
-
-        # Trap keypress if blanket ignore to prevent it going back up to
-        # the top.
-        if self.ignore_keys == 'all':
+        # Next check for specific ignored keys.  Trap keypress if blanket
+        # ignore to prevent it going back up to the top.
+        if self._ignore_all or key in self._ignore_set:
             return None
 
         return key
@@ -318,6 +363,12 @@ class DialogBase(urwid.WidgetWrap):
         # within DialogBase to provide a return value and exit the dialog.
         # This is similar to how urwid uses the ExitMainLoop exception,
         # but also requires the nested_run function (see below).
+        # A dialog may be started more than once, always overlay the
+        # current widget.
+        if self.bottom_w is not current_widget:
+            self.bottom_w = current_widget
+            self.overlay.bottom_w = current_widget
+
         try:
             loop.widget = self
             loop.event_loop.nested_run()
@@ -353,7 +404,7 @@ class SimpleDialog(object):
         if markup is not None and widget is not None:
             raise UIError('markup and widget both set')
 
-        if isinstance(widget, basestring):
+        if isinstance(widget, util.STRING_TYPES):
             # urwid just gives error about invalid rows or height if you
             # make this mistake.
             raise UIError('use markup argument for strings')
@@ -364,16 +415,23 @@ class SimpleDialog(object):
         if not isinstance(widget, (tuple, list)):
             widget = [widget,]
 
-        listbox = ui_base.ListBoxBase(urwid.SimpleListWalker(widget))
+        self.listbox = ui_base.ListBoxBase(urwid.SimpleListWalker(widget))
 
         self.ui = ui
 
-        self.dialog_frame = DialogFrameWidget(ui, listbox, title=title,
+        self.dialog_frame = DialogFrameWidget(ui, self.listbox, title=title,
                 title_attr=title_attr, buttons=buttons, button_focus=True)
 
         self.dialog = DialogBase(ui, self.dialog_frame, ui.loop.widget,
                 width=width, height=height, ignore_keys=ignore_keys)
 
+    def reset_focus(self):
+        """Scroll body to the top and restore the initial button focus.  Use
+        before starting a dialog again."""
+        if len(self.listbox.body) != 0:
+            self.listbox.set_focus(0, coming_from='above')
+        self.dialog_frame.reset_focus()
+
     def start(self):
         """Start dialog and return status on exit."""
         return self.dialog.start()
@@ -434,9 +492,8 @@ class BusyDialog(SimpleDialog):
 
         if clear_input is True:
             codes = loop.screen.get_available_raw_input()
-            dropped = len(codes)
-            if dropped:
-                log.debug('dropping {} code(s)'.format(dropped))
+            if codes:
+                log.debug('dropping %d code(s)', len(codes))
 
 
 class ConfirmDialog(SimpleDialog):
@@ -500,8 +557,8 @@ class ErrorDialog(SimpleDialog):
         )
 
         super(ErrorDialog, self).__init__(ui, markup=markup, widget=widget,
-                width=width, height=height, title='ERROR',
-                title_attr='error', buttons=buttons, ignore_keys=ignore_keys)
+                width=width, height=height, title=_ERROR_TITLE,
+                buttons=buttons, ignore_keys=ignore_keys)
 
 
 class SimpleEditDialog(object):
@@ -530,7 +587,7 @@ class SimpleEditDialog(object):
         if markup is not None and widget is not None:
             raise UIError('markup and widget both set')
 
-        if isinstance(widget, basestring):
+        if isinstance(widget, util.STRING_TYPES):
             # urwid just gives error about invalid rows or height if you
             # make this mistake.
             raise UIError('use markup argument for strings')
@@ -550,7 +607,7 @@ class SimpleEditDialog(object):
             self.edit.edit_text = default
             self.edit.edit_pos = len(default)
 
-        edit_attr = urwid.AttrMap(self.edit, {None: 'body'}, {None: 'focus'})
+        edit_attr = urwid.AttrMap(self.edit, _BODY_MAP, _FOCUS_MAP)
         widget.append(edit_attr)
 
         listbox = urwid.ListBox(urwid.SimpleListWalker(widget))
@@ -617,19 +674,17 @@ class OnFocusEditDialog(object):
             else:
                 widgets = [ui_base.markup_to_text(markup,
                         align=urwid.CENTER),]
-            if hasattr(edit_mapping, 'iteritems'):
-                items = edit_mapping.iteritems()
-            elif hasattr(edit_mapping, 'items'):
+            try:
                 items = edit_mapping.items()
-            else:
+            except AttributeError:
                 raise TypeError('edit_mapping must support item iteration')
 
             mapping = {}
             for edit_key, edit_value in items:
                 edit_widget = self._edit_value_to_widget(edit_value)
                 mapping[edit_key] = edit_widget
-                edit_widget = urwid.AttrMap(edit_widget, {None: 'body'},
-                        {None: 'focus'})
+                edit_widget = urwid.AttrMap(edit_widget, _BODY_MAP,
+                        _FOCUS_MAP)
                 widgets.append(edit_widget)
 
             self._edit_mapping = mapping
@@ -638,8 +693,7 @@ class OnFocusEditDialog(object):
         self.list_walker.set_focus_changed_callback(self.focus_changed)
         listbox = urwid.ListBox(self.list_walker)
 
-        listbox._command_map = listbox._command_map.copy()
-        listbox._command_map['enter'] = urwid.CURSOR_DOWN
+        listbox._command_map = _edit_command_map()
 
         buttons = (
             ('OK', DialogFrameWidget.btnexit, 1, True),
@@ -658,11 +712,11 @@ class OnFocusEditDialog(object):
     def _edit_value_to_widget(self, edit_value):
         """Change edit_value from mapping to a uwrid.Edit widget.  Overload
         this to change how edit_mapping is used by the class."""
-        if isinstance(edit_value, basestring):
+        if isinstance(edit_value, util.STRING_TYPES):
             widget = urwid.Edit(caption=edit_value)
         else:
             caption = edit_value[0]
-            edit_text = util.getindex(edit_value, 1, u'')
+            edit_text = edit_value[1] if len(edit_value) > 1 else u''
             widget = urwid.Edit(caption=caption, edit_text=edit_text)
 
         return widget
@@ -685,16 +739,16 @@ class OnFocusEditDialog(object):
         """Callback when focus changes between body and buttons or when focus
         changes between widgets in body (handled by
         urwid.SimpleFocusListWalker)."""
+        walker_focus = self.list_walker.focus
         if new_focus >= 0:
-            focus_out = self.list_walker.focus
+            focus_out = walker_focus
             focus_in = new_focus
+        elif self.dialog_frame.focus_position == 'body':
+            focus_out = None
+            focus_in = walker_focus
         else:
-            if self.dialog_frame.focus_position == 'body':
-                focus_out = None
-                focus_in = self.list_walker.focus
-            else:
-                focus_out = self.list_walker.focus
-                focus_in = None
+            focus_out = walker_focus
+            focus_in = None
 
         widget_out = self.get_widget(focus_out)
         if hasattr(widget_out, 'on_focus_out'):
@@ -737,12 +791,13 @@ class ValidatedEditDialog(OnFocusEditDialog):
     def _edit_value_to_widget(self, edit_value):
         """Change edit_value from mapping to a ui_base.ValidatedEdit
         widget."""
-        if isinstance(edit_value, basestring):
+        if isinstance(edit_value, util.STRING_TYPES):
             widget = ui_base.ValidatedEdit(caption=edit_value)
         else:
+            value_len = len(edit_value)
             caption = edit_value[0]
-            edit_text = util.getindex(edit_value, 1, u'')
-            validator = util.getindex(edit_value, 2, None)
+            edit_text = edit_value[1] if value_len > 1 else u''
+            validator = edit_value[2] if value_len > 2 else None
             widget = ui_base.ValidatedEdit(caption=caption,
                     edit_text=edit_text, validator=validator)
 
@@ -761,9 +816,11 @@ class ValidatedEditDialog(OnFocusEditDialog):
         try:
             widget.on_focus_out()
         except ValidatedEditError as e:
-            err_msg = util.exception_string(e)
             orig_err_msg = util.exception_string(e.orig_exc)
-            log.info('{} caused by: {}'.format(err_msg, orig_err_msg))
+            # The full error string is only used for logging.
+            if log.isEnabledFor(logging.INFO):
+                log.info('%s caused by: %s', util.exception_string(e),
+                        orig_err_msg)
 
             markup = '{}\ncaused by: {}'.format(str(e), orig_err_msg)
             widget = ui_base.markup_to_text(markup, align=urwid.LEFT,
@@ -781,6 +838,13 @@ class SearchDialog(object):
     """Predefined search dialog with any/all/not edit boxes and optional
     table and column."""
 
+    # Search term edit boxes shared by all instances.
+    _terms_mapping = (
+        ('all_terms', ('all terms: ', '', shlex.split)),
+        ('any_terms', ('any terms: ', '', shlex.split)),
+        ('not_terms', ('not terms: ', '', shlex.split))
+    )
+
     def __init__(self, ui, search_type=None, title=None, prompt_table=False,
             prompt_column=False):
         """Initializer.  Either search_type or title must be defined,
@@ -808,11 +872,7 @@ class SearchDialog(object):
         if prompt_column is True:
             edit_mapping.append(('column', 'column: '))
 
-        edit_mapping += [
-                ('all_terms', ('all terms: ', '', shlex.split)),
-                ('any_terms', ('any terms: ', '', shlex.split)),
-                ('not_terms', ('not terms: ', '', shlex.split))
-        ]
+        edit_mapping.extend(self._terms_mapping)
 
         edit_mapping = collections.OrderedDict(edit_mapping)
         height += len(edit_mapping)
@@ -830,26 +890,30 @@ class EditPreferencesDialog(object):
     """Edit preferences dialog."""
 
     def __init__(self, ui):
-        """Initializer.
+        """Initializer.  The dialog is built by start so preference values
+        are read when it is shown.
 
         Args:
             ui: ui_top.UIMain.
         """
+        self.ui = ui
+        self.dialog = None
+
+    def _build_dialog(self):
+        """Build ValidatedEditDialog from current preferences."""
+        ui = self.ui
         height = DIALOG_BASE_ROWS_COLS[0] + DIALOG_TITLE_ROWS
 
-        edit_mapping = []
-        for pref_key, pref_value in prefs.iterprefs():
-            validator = functools.partial(prefs.convert, pref_key)
+        # prefs.keys() is cached and already sorted.
+        edit_mapping = collections.OrderedDict()
+        for pref_key in prefs.keys():
+            validator = prefs.validator(pref_key)
             caption = '{}: '.format(pref_key)
-            mapping = (pref_key, (caption, str(pref_value), validator))
-            edit_mapping.append(mapping)
-
-        edit_mapping.sort(key=operator.itemgetter(0))
+            edit_mapping[pref_key] = (caption, str(prefs.get(pref_key)),
+                    validator)
 
-        for mapping in edit_mapping:
-            log.debug(mapping)
-
-        edit_mapping = collections.OrderedDict(edit_mapping)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('edit prefs mapping: %s', edit_mapping.items())
 
         height += len(edit_mapping)
         height = ui_base.min_height(height, (urwid.RELATIVE, 80),
@@ -861,13 +925,16 @@ class EditPreferencesDialog(object):
 
     def start(self):
         """Start dialog, if OK is hit log preferences and save to database."""
+        if self.dialog is None:
+            self._build_dialog()
+
         mapping = self.dialog.start()
         if mapping is None:
             return
 
-        log.debug('edit prefs: {}'.format(mapping))
+        log.debug('edit prefs: %s', mapping)
 
-        for pref_key, pref_value in mapping.iteritems():
+        for pref_key, pref_value in mapping.items():
             prefs.set(pref_key, pref_value)
 
         prefs.save()
@@ -900,12 +967,39 @@ class SaveDialog(object):
         self.dialog = SimpleEditDialog(ui, 'path', default=default,
                 width=(urwid.RELATIVE, 80), height=height, title=title)
 
+    def _message_dialog(self, dialogs, dialog_class, markup, rows_cols):
+        """Get a sized message dialog for markup.
+
+        Args:
+            dialogs: dict of dialogs by markup, reused with their focus reset
+                when the same path is entered again.
+            dialog_class: ConfirmDialog or ErrorDialog.
+            markup: urwid markup to use as body.
+            rows_cols: tuple of rows and columns added to the body size.
+
+        Returns:
+            dialog_class instance.
+        """
+        dialog = dialogs.get(markup)
+        if dialog is None:
+            widget = ui_base.markup_to_text(markup, align=urwid.CENTER)
+            width, _ = self.ui.get_screen_relative((80, None))
+            width, height = widget.original_widget.pack((width,))
+            dialog = dialog_class(self.ui, widget=widget,
+                    width=width + rows_cols[1],
+                    height=height + rows_cols[0])
+            dialogs[markup] = dialog
+        else:
+            dialog.reset_focus()
+        return dialog
+
     def start(self):
         """Start dialog.  If OK is hit test if path if file can be created or
         written."""
+        dialogs = {}
         while True:
             path = self.dialog.start()
-            log.debug('export dialog returned: \'{}\''.format(path))
+            log.debug('export dialog returned: \'%s\'', path)
             if path is None or path == '':
                 path = None
                 break
@@ -917,23 +1011,15 @@ class SaveDialog(object):
                 markup = ('\'{}\' already exists.\n'
                         'Are you sure you want to overwrite?')
                 markup = markup.format(path)
-                widget = ui_base.markup_to_text(markup, align=urwid.CENTER)
-                width, _ = self.ui.get_screen_relative((80, None))
-                width, height = widget.original_widget.pack((width,))
-                dialog = ConfirmDialog(self.ui, widget=widget,
-                        width=width + DIALOG_BASE_ROWS_COLS[1],
-                        height=height + DIALOG_BASE_ROWS_COLS[0])
+                dialog = self._message_dialog(dialogs, ConfirmDialog, markup,
+                        DIALOG_BASE_ROWS_COLS)
                 ret = dialog.start()
                 if ret == 1:
                     break
-            elif ret in self._err_mapping.keys():
+            elif ret in self._err_mapping:
                 markup = self._err_mapping[ret].format(path=path)
-                widget = ui_base.markup_to_text(markup, align=urwid.CENTER)
-                width, _ = self.ui.get_screen_relative((80, None))
-                width, height = widget.original_widget.pack((width,))
-                dialog = ErrorDialog(self.ui, widget=widget,
-                        width=width + ERROR_DIALOG_ROWS_COLS[1],
-                        height=height + ERROR_DIALOG_ROWS_COLS[0])
+                dialog = self._message_dialog(dialogs, ErrorDialog, markup,
+                        ERROR_DIALOG_ROWS_COLS)
                 dialog.start()
             else:
                 err = 'unexpected error \'{}\' for path \'{}\''.format(
@@ -20,11 +20,10 @@
 
 import datetime
 import logging
-import operator
 import os
 import sqlite3
+import sys
 import textwrap
-import traceback
 import unicodedata
 import urwid
 
@@ -35,7 +34,7 @@ from . import prefs
 from . import ui_base
 from . import ui_dialog
 from . import util
-from .exceptions import UIError, DBDriverError, ExportError
+from .exceptions import DBDriverError, ExportError
 
 
 log = logging.getLogger(__name__)
@@ -46,6 +45,25 @@ _D_ARROW = unicodedata.lookup('DOWNWARDS ARROW')
 _U_ARROW = unicodedata.lookup('UPWARDS ARROW')
 _R_ARROW = unicodedata.lookup('RIGHTWARDS ARROW')
 
+# Function names that mark the stack as rendering, see UIMain.flush.
+_RENDER_FUNCS = frozenset(('render', 'cached_render'))
+
+# Memo of _wrap results by (text, width), cleared when full.
+_wrap_cache = {}
+_WRAP_CACHE_MAX = 256
+
+
+def _wrap(text, width):
+    """Memoized textwrap.wrap, the returned list must not be modified."""
+    key = (text, width)
+    lines = _wrap_cache.get(key)
+    if lines is None:
+        lines = textwrap.wrap(text, width)
+        if len(_wrap_cache) >= _WRAP_CACHE_MAX:
+            _wrap_cache.clear()
+        _wrap_cache[key] = lines
+    return lines
+
 
 # changes on restart.
 prefs.add('ui.log.view.lines', int, True, default=20,
@@ -64,6 +82,11 @@ class UITreeWidget(urwid.TreeWidget):
             node: corresponding urwid.TreeNode.
         """
         self._expanded = False
+        # Optional node methods resolved once, expanded is set during
+        # urwid.TreeWidget init so these must be set before.
+        self._node_on_expand = getattr(node, 'on_expand', None)
+        self._node_on_collapse = getattr(node, 'on_collapse', None)
+        self._node_get_ui = getattr(node, 'get_ui', None)
 
         super(UITreeWidget, self).__init__(node)
         self._w = urwid.AttrMap(self._w, {None: 'body'}, {None: 'focus'})
@@ -80,41 +103,36 @@ class UITreeWidget(urwid.TreeWidget):
         # UITreeWidget will set it back to False.  The tree widget nodes
         # should be able to handle on_expand/on_collapse quickly (at
         # least during init).
-        node = self.get_node()
-        if hasattr(node, 'on_expand') and value is True \
-                and self._expanded is False:
-            node.on_expand()
-        elif hasattr(node, 'on_collapse') and value is False \
-                and self._expanded is True:
-            node.on_collapse()
+        if value is True and self._expanded is False:
+            if self._node_on_expand is not None:
+                self._node_on_expand()
+        elif value is False and self._expanded is True:
+            if self._node_on_collapse is not None:
+                self._node_on_collapse()
 
         self._expanded = value
 
     def get_ui(self):
         """Get UIMain object."""
-        node = self.get_node()
-        if hasattr(node, 'get_ui'):
-            return node.get_ui()
-        elif hasattr(node, 'ui'):
-            return node.ui
-        else:
-            return None
+        if self._node_get_ui is not None:
+            return self._node_get_ui()
+        return getattr(self._node, 'ui', None)
 
     def get_display_text(self):
         """Get display text to be used as line in tree view.  Defers to
         node."""
-        return self.get_node().get_display_text()
+        return self._node.get_display_text()
 
     def get_node_type(self):
         """Get node type string, used to generate title for detailed mapping
         dialog.  Defers to node."""
-        return self.get_node().get_type()
+        return self._node.get_type()
 
     def get_node_detail_mapping(self):
         """Get detail mapping from node."""
-        node = self.get_node()
+        node = self._node
         if hasattr(node, 'get_detail_mapping'):
-            return self.get_node().get_detail_mapping()
+            return node.get_detail_mapping()
         return None
 
     def show_node_detail_mapping(self, key):
@@ -125,7 +143,7 @@ class UITreeWidget(urwid.TreeWidget):
             return key
 
         node_type = self.get_node_type()
-        ui = self.get_node().get_ui()
+        ui = self._node.get_ui()
         view_mapping = UIViewMappingDialog(ui, node_type, node_mapping,
                 ui.loop.widget)
         view_mapping.start()
@@ -161,24 +179,20 @@ class UIViewMappingDialog(object):
             max_height (optional): urwid dimension tuple, mapping data is
                 scrollable if it can not be displayed at once.
         """
-        # dict or list of items.
-        if hasattr(mapping, 'keys'):
-            keys = mapping.keys()
+        # dict or list of items, materialized once for sizing and rows.
+        if hasattr(mapping, 'items'):
+            mapping = list(mapping.items())
         else:
-            keys = [x for x in zip(*mapping)[0]]
-
-        max_key_len = max([len(str(x)) for x in keys])
+            mapping = list(mapping)
 
-        if hasattr(mapping, 'iteritems'):
-            mapping = mapping.iteritems()
-        elif hasattr(mapping, 'items'):
-            mapping = mapping.items()
+        max_key_len = max(len(str(x[0])) for x in mapping)
 
         fmt = '{:<{width}} | {}'
-        text = [ui_base.SelectableText(fmt.format(k, v, width=max_key_len),
-                wrap=urwid.CLIP) for k,v in mapping]
-        text = [urwid.AttrMap(x, {None: 'body'}, {None: 'focus'})
-                for x in text]
+        attr_map = {None: 'body'}
+        focus_map = {None: 'focus'}
+        text = [urwid.AttrMap(ui_base.SelectableText(
+                fmt.format(k, v, width=max_key_len), wrap=urwid.CLIP),
+                attr_map, focus_map) for k, v in mapping]
         body = ui_base.ListBoxBase(urwid.SimpleListWalker(text))
 
         dfw = ui_dialog.DialogFrameWidget(ui, body,
@@ -189,7 +203,7 @@ class UIViewMappingDialog(object):
 
         # This will change if the layout of DialogBase changes or
         # UIViewMappingDialog changes the header or footer.
-        required_rows = len(keys) + ui_dialog.DIALOG_BASE_ROWS_COLS[0]
+        required_rows = len(mapping) + ui_dialog.DIALOG_BASE_ROWS_COLS[0]
 
         # See if we can fit the rows to the exact number required to show
         # everything in the mapping.
@@ -302,9 +316,9 @@ class UISearchListBox(ui_base.ListBoxBase):
         """
         self.ui = ui
 
-        if isinstance(text_attr, basestring):
+        if isinstance(text_attr, util.STRING_TYPES):
             text_attr = {None: text_attr}
-        if isinstance(text_focus_attr, basestring):
+        if isinstance(text_focus_attr, util.STRING_TYPES):
             text_focus_attr = {None: text_focus_attr}
 
         data = self.init_result_data(iterable, text_attr, text_focus_attr)
@@ -323,7 +337,7 @@ class UISearchListBox(ui_base.ListBoxBase):
             focus_attr (optional): focus attr key.
         """
         for value in iterable:
-            if isinstance(value, basestring):
+            if isinstance(value, util.STRING_TYPES):
                 value = ui_base.SelectableText(value)
                 value = urwid.AttrMap(value, text_attr, text_focus_attr)
                 yield value
@@ -403,19 +417,24 @@ class UIRowDOSearchListBox(UISearchListBox):
             attr (optional): default attr key.
             focus_attr (optional): focus attr key.
         """
+        # Bound once, this runs for every search result row.
+        rdo_type = dbdrv.RowDO
+        rdo_name = self.rdo_name
+        format_rdo = self.format_rdo
+        selectable_text = ui_base.SelectableText
+
         try:
             for rdo in iterable:
-                if not isinstance(rdo, dbdrv.RowDO):
+                if not isinstance(rdo, rdo_type):
                     err = 'iterable must contain only dbdrv.RowDO'
                     raise TypeError(err)
-                if self.rdo_name is not None \
-                        and self.rdo_name != rdo.name:
+                if rdo_name is not None and rdo_name != rdo.name:
                     err = ('iterable must contain only \'{}\' '
-                            'dbdrv.RowDO').format(self.rdo_name)
+                            'dbdrv.RowDO').format(rdo_name)
                     raise TypeError(err)
 
-                text = self.format_rdo(rdo)
-                value = ui_base.SelectableText(text)
+                text = format_rdo(rdo)
+                value = selectable_text(text)
 
                 # Attach table row to text node (used for
                 # get_detail_mapping).
@@ -478,12 +497,18 @@ class UIRowDOSearchListBox(UISearchListBox):
         exporter.write_hdr(keys)
         exporter.write_blank()
 
+        write_row = exporter.write_row
+        get_rdo = self.get_rdo
+        attr_map = urwid.AttrMap
         for widget in ui_base.listbox_contents_iter(contents):
             # Not modifying rdo with the generic implementation, no need to
-            # make a copy.
-            rdo = self.get_rdo(widget)
-            values = rdo.values(keys)
-            exporter.write_row(values)
+            # make a copy.  Rows from init_result_data are AttrMap wrapped,
+            # anything else goes through get_rdo.
+            if type(widget) is attr_map:
+                rdo = widget.original_widget.rdo
+            else:
+                rdo = get_rdo(widget)
+            write_row(rdo.values(keys))
 
 
 class TableNode(ui_base.WeakRefTreeRootNodeList,
@@ -524,11 +549,8 @@ class TableNode(ui_base.WeakRefTreeRootNodeList,
         Returns:
             Sibling TableNode.
         """
-        sibling = self.get_sibling(key)
-        if sibling['node'] is None:
-            sibling['node'] = TableNode(self.db, self.ui,
-                    self.get_value_list(), key=key)
-        return sibling['node']
+        return self._sibling_node(key, lambda siblings, key:
+                TableNode(self.db, self.ui, siblings, key=key))
 
     def get_ui(self):
         """Get UIMain object."""
@@ -636,17 +658,23 @@ class UILoggingHandler(logging.Handler):
         'DEBUG': 'log debug',
         'NOTSET': 'log notset',
     }
+    # Lines allowed over max_history before trimming, trimming in batches
+    # avoids removing from the front of the history list on every record.
+    trim_batch = 32
 
     def __init__(self, max_history=100, disable_stderr=False):
         """Initializer.
 
         Args:
             max_history (optional): int max logging lines stored in internal
-                SimpleListWalker.
+                SimpleListWalker.  History may grow up to trim_batch lines
+                over max_history before being trimmed.
             disable_stderr (optional): bool if stderr is always disabled.
         """
         super(UILoggingHandler, self).__init__()
         self.flush_ui = None
+        # Set when a record is added to the history and cleared by flush.
+        self._flush_pending = False
         self.max_history = max_history
         self.log_history = urwid.SimpleListWalker(list())
         if disable_stderr is True:
@@ -657,8 +685,10 @@ class UILoggingHandler(logging.Handler):
 
     def flush(self):
         """Flush UI if connected.  Used to update the UI log while busy inside
-        the main loop."""
-        if self.flush_ui is not None:
+        the main loop.  The screen is only drawn if records were added since
+        the last flush."""
+        if self.flush_ui is not None and self._flush_pending:
+            self._flush_pending = False
             self.flush_ui(frame_offset=1)
 
     def setLevel(self, level):
@@ -694,12 +724,13 @@ class UILoggingHandler(logging.Handler):
             msg._sh_emit = self.stream is not None
 
             self.log_history.append(msg)
+            self._flush_pending = True
 
             log_size = len(self.log_history)
-            if self.max_history > 0 and log_size > self.max_history:
-                # Should only ever increment by one.
-                self.log_history.pop(0)
-                log_size -= 1
+            if self.max_history > 0 and \
+                    log_size > self.max_history + self.trim_batch:
+                del self.log_history[:log_size - self.max_history]
+                log_size = self.max_history
 
             self.log_history.focus = log_size - 1
         except (KeyboardInterrupt, SystemExit):
@@ -833,6 +864,22 @@ class UIMain(object):
         'Search results'
     ]
 
+    # Top level key map of handler method names, values are tuples in the
+    # format (<handler name>, <bool if dialog nestable>).
+    dialog_key_map = {
+        '/':        ('handle_help',     False),
+        '?':        ('handle_help',     False),
+        'e':        ('handle_export',   False),
+        'E':        ('handle_export',   False),
+        'q':        ('handle_quit',     True),
+        'Q':        ('handle_quit',     True),
+        's':        ('handle_search',   False),
+        'S':        ('handle_search',   False),
+        'u':        ('handle_update',   False),
+        'U':        ('handle_update',   False),
+        'ctrl p':   ('handle_prefs',    False)
+    }
+
     def __init__(self, db, dl_dir, log_handler=None):
         """Initializer.
 
@@ -843,6 +890,12 @@ class UIMain(object):
         """
         self._running = False
         self._in_dialog = False
+        # Last help widget as (key, widget), see handle_help.
+        self._help_cache = None
+        # Dialogs reused between invocations, see handle_help and
+        # handle_quit.  _help_dialog is (help widget, SimpleDialog).
+        self._help_dialog = None
+        self._quit_dialog = None
         self.init_dialog_key_map()
         self._export_timestamp = True
 
@@ -870,6 +923,7 @@ class UIMain(object):
         # Set current view to data (this is used to switch between
         # data and search view).
         self.current_view = self.data_view
+        self._current_view_name = 'data'
 
         if log_handler is not None:
             # If a log_handler is passed in create a log view as a listbox.
@@ -912,30 +966,17 @@ class UIMain(object):
         self.loop.widget = self.app_view
 
     def init_dialog_key_map(self):
-        """Initialize top level key map to be mapped with handlers.  Values in
-        key map are tuples in the format (<handler>, <bool if dialog
-        nestable>)."""
-        self._dialog_key_map = {
-            '/':        (self.handle_help,      False),
-            '?':        (self.handle_help,      False),
-            'e':        (self.handle_export,    False),
-            'E':        (self.handle_export,    False),
-            'q':        (self.handle_quit,      True),
-            'Q':        (self.handle_quit,      True),
-            's':        (self.handle_search,    False),
-            'S':        (self.handle_search,    False),
-            'u':        (self.handle_update,    False),
-            'U':        (self.handle_update,    False),
-            'ctrl p':   (self.handle_prefs,     False)
-        }
+        """Initialize top level key map to be mapped with handlers.  The
+        class dialog_key_map is shared, handlers are looked up by name when a
+        key is handled so no bound methods are created here."""
+        self._dialog_key_map = self.dialog_key_map
 
     def init_log_palette(self):
-        """Init log palette."""
-        palette_keys = zip(*self.palette)[0]
-        for lp in self.log_palette:
-            key = lp[0]
-            if key not in palette_keys:
-                self.palette += (lp,)
+        """Init log palette.  Log palette entries not already in palette are
+        added to a copy of palette for this instance."""
+        palette_keys = set(x[0] for x in self.palette)
+        self.palette = self.palette + [x for x in self.log_palette
+                if x[0] not in palette_keys]
 
     def init_data_view(self):
         """Initialize data view using TableNodes for each table in the
@@ -951,8 +992,13 @@ class UIMain(object):
 
     @property
     def screen_cols_rows(self):
-        """Return current screen dimension (columns, rows) from main loop."""
-        return self.loop.screen.get_cols_rows()
+        """Return current screen dimension (columns, rows) from main loop.
+        Uses the size cached by the main loop for drawing, which it resets on
+        window resize, and only queries the screen if not set."""
+        cols_rows = getattr(self.loop, 'screen_size', None)
+        if not cols_rows:
+            cols_rows = self.loop.screen.get_cols_rows()
+        return cols_rows
 
     @property
     def screen_cols(self):
@@ -1015,22 +1061,20 @@ class UIMain(object):
 
         if not force_flush:
             # Calling draw_screen while rendering can cause a maximum recursion
-            # error in Python.
-            fn_skip = ['render', 'cached_render']
-            if frame_offset > 0:
-                frame_offset *= -1
-
-            tb = traceback.extract_stack()
-            fn_list = map(operator.itemgetter(2), tb)
-            if any([x in fn_list for x in fn_skip]):
-                fmt = ('flush called in render chain, deferring call '
-                        'from {} {}:{}')
-                # self.flush frame is tb[-1], caller frame is tb[-2].
-                frame = tb[-2 + frame_offset]
-                # frame format (file, line, caller function, call source)
-                log.error(fmt.format(frame[2], os.path.split(frame[0])[1],
-                        frame[1]))
-                return
+            # error in Python.  Walk the frames directly, extracting a
+            # traceback would read source lines for every frame.
+            frame = sys._getframe(1)
+            while frame is not None:
+                if frame.f_code.co_name in _RENDER_FUNCS:
+                    fmt = ('flush called in render chain, deferring call '
+                            'from %s %s:%d')
+                    # self.flush frame is 0, caller frame is 1.
+                    caller = sys._getframe(1 + abs(frame_offset))
+                    log.error(fmt, caller.f_code.co_name,
+                            os.path.split(caller.f_code.co_filename)[1],
+                            caller.f_lineno)
+                    return
+                frame = frame.f_back
 
         self.loop.draw_screen()
 
@@ -1079,7 +1123,7 @@ class UIMain(object):
             nested_dialog (optional): bool to only call handler/dialog if lock
                 was acquired.
         """
-        was_in_dialog = self.in_dialog()
+        was_in_dialog = self._in_dialog
         # Note: enter_dialog must be called before checking nested_dialog to
         # set self._in_dialog if nested_dialog is True.
         if self.enter_dialog() is False and nested_dialog is False:
@@ -1131,13 +1175,7 @@ class UIMain(object):
 
     def get_current_view(self):
         """Return 'data' or 'search' depending on current data view."""
-        if self.current_view == self.data_view:
-            return 'data'
-        elif self.current_view == self.search_view:
-            return 'search'
-        else:
-            raise UIError('unknown current view for object: {}'.format(
-                    str(self.current_view)))
+        return self._current_view_name
 
     def set_current_view(self, view):
         """Set current data view to 'data' or 'search'.  Actual widgets
@@ -1148,6 +1186,7 @@ class UIMain(object):
             self.current_view = self.search_view
         else:
             raise ValueError('view must be \'data\' or \'search\'')
+        self._current_view_name = view
 
         if self.log_view is None:
             # No log view, current view is the body of the app view frame.
@@ -1160,7 +1199,7 @@ class UIMain(object):
 
     def switch_current_view(self):
         """Switch current view between 'data' and 'search'."""
-        if self.get_current_view == 'data':
+        if self.get_current_view() == 'data':
             self.set_current_view('search')
         else:
             self.set_current_view('data')
@@ -1184,19 +1223,39 @@ class UIMain(object):
         """Display help dialog using markup in self.help_markup_list.
         Preferences with their default and help are dynamically generated and
         shown too."""
+        widget = self._help_widget()
+        if self._help_dialog is not None and \
+                self._help_dialog[0] is widget:
+            dialog = self._help_dialog[1]
+            dialog.reset_focus()
+        else:
+            dialog = ui_dialog.SimpleDialog(self, widget=widget,
+                    width=(urwid.RELATIVE, 80), height=(urwid.RELATIVE, 80),
+                    title='Help', title_attr='help header')
+            self._help_dialog = (widget, dialog)
+        dialog.start()
+
+    def _help_widget(self):
+        """Return help text widgets for handle_help.  The last result is
+        cached until the screen width or a preference value changes."""
+        screen_cols = self.screen_cols
+        cache_key = (screen_cols, tuple(prefs.iterprefs()))
+        if self._help_cache is not None and \
+                self._help_cache[0] == cache_key:
+            return self._help_cache[1]
 
         width = (urwid.RELATIVE, 80)
 
         # Used to indent the preference help strings.
         tw_indent = ' ' * 4
-        tw_width = ui_base.given_width(width, self.screen_cols) \
+        tw_width = ui_base.given_width(width, screen_cols) \
                 - len(tw_indent) - ui_dialog.DIALOG_BASE_ROWS_COLS[1]
 
         pref_markup_list = [
             '',
             ('help underline', 'Preferences:'),
         ]
-        for pref_key in sorted(prefs.keys()):
+        for pref_key in prefs.keys():
             p = prefs.get_pref(pref_key)
             type_str = getattr(p.value_type, '__name__', repr(p.value_type))
 
@@ -1210,8 +1269,8 @@ class UIMain(object):
             pref_markup_list.append(markup)
 
             hlp = p.help
-            if isinstance(hlp, basestring) and hlp != '':
-                hlp = textwrap.wrap('Help: ' + hlp, tw_width)
+            if isinstance(hlp, util.STRING_TYPES) and hlp != '':
+                hlp = _wrap('Help: ' + hlp, tw_width)
                 for line in hlp:
                     pref_markup_list.append('{}{}'.format(tw_indent, line))
 
@@ -1219,9 +1278,8 @@ class UIMain(object):
 
         widget = ui_base.markup_list_to_text(
                 self.help_markup_list + pref_markup_list, attr='help')
-        ui_dialog.SimpleDialog(self, widget=widget,
-                width=(urwid.RELATIVE, 80), height=(urwid.RELATIVE, 80),
-                title='Help', title_attr='help header').start()
+        self._help_cache = (cache_key, widget)
+        return widget
 
     def export_timestamp(self, exporter):
         """Write formatted timestamp to exporter."""
@@ -1250,7 +1308,7 @@ class UIMain(object):
 
         if callable(export_header):
             export_header(exporter)
-        elif isinstance(export_header, basestring):
+        elif isinstance(export_header, util.STRING_TYPES):
             exporter.write_hdr(export_header)
 
         current_widget.export(exporter)
@@ -1286,8 +1344,14 @@ class UIMain(object):
         """Show quit dialog and exit if OK is selected.  Quit dialog will
         always be displayed even if there is an active dialog.  It will set the
         dialog set to prevent any other dialogs before returning."""
-        quit_dialog = ui_dialog.ConfirmDialog(self, markup='Exit program?',
-                width=40, height=10, ignore_keys=('q', 'Q'))
+        quit_dialog = self._quit_dialog
+        if quit_dialog is None:
+            quit_dialog = ui_dialog.ConfirmDialog(self,
+                    markup='Exit program?', width=40, height=10,
+                    ignore_keys=('q', 'Q'))
+            self._quit_dialog = quit_dialog
+        else:
+            quit_dialog.reset_focus()
         ret = quit_dialog.start()
         if ret == 1:
             self.shutdown()
@@ -1364,16 +1428,19 @@ class UIMain(object):
     def handle_prefs(self, key):
         """Show edit preferences dialog."""
         ui_dialog.EditPreferencesDialog(self).start()
+        # Help shows preference values.
+        self._help_cache = None
 
     def unhandled_input(self, key):
         """Catch esc and tab keys to navigate between log/data/search views.
         Handles all keys in self._dialog_key_map."""
-        if self._dialog_key_map.has_key(key):
-            func, nested_dialog = self._dialog_key_map[key]
-            self.do_dialog(func, key, nested_dialog)
+        handler = self._dialog_key_map.get(key)
+        if handler is not None:
+            func_name, nested_dialog = handler
+            self.do_dialog(getattr(self, func_name), key, nested_dialog)
         elif key == 'esc':
             if self.get_current_view() == 'search':
                 self.set_current_view('data')
         elif key == 'tab':
-            if not self.in_dialog():
+            if not self._in_dialog:
                 self.switch_main_focus()
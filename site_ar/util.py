@@ -20,10 +20,8 @@
 
 import collections
 import importlib
-import copy
 import errno
 import logging
-import md5
 import os
 import re
 import shlex
@@ -37,8 +35,23 @@ PRICEFIND = re.compile(r'[+-]?[0-9]{1,3}(?:,?[0-9]{3})*\.[0-9]{2}')
 PRICEFMT = '{:,.02f}'
 CSV_PRICEFMT = '\'' + PRICEFMT
 
+# String types for isinstance checks, basestring only exists in Python 2.
+try:
+    STRING_TYPES = (basestring,)
+except NameError:
+    STRING_TYPES = (str,)
+
 _NOINDEX = object()
 
+_WHITESPACE = re.compile(r'\s+')
+
+# boolstr results for common non-numeric strings, skips the failed float.
+_BOOLSTR_WORDS = {
+    'false': False,
+    'true': True,
+    '': False,
+}
+
 
 def flush_log():
     """Calls flush if exists all handlers in RootLogger."""
@@ -122,55 +135,6 @@ def require_dir(path):
         raise IOError(errno.ENOENT, 'No such file or directory', path)
 
 
-def unused_path(prefix, ext, max_tries=100):
-    """Finds an unused path using a counter in the format
-    <prefex>[-<DDDD>]<ext>.
-
-    Args:
-        prefex: path prefix string.
-        ext: path extension string.
-        max_tries (optional): int max number of paths to try before failing
-            (default 100).
-
-    Returns:
-        unused string path or None if max_tries exceeded.
-    """
-    path = '{}{}{}'.format(prefix, os.path.extsep, ext)
-    if not os.path.exists(path):
-        return path
-
-    for x in range(max_tries):
-        path = '{}-{:04d}{}{}'.format(prefix, x, os.path.extsep, ext)
-        if not os.path.exists(path):
-            return path
-
-    return None
-
-
-def md5_path(data, directory, ext):
-    """Creates a path based on md5 hash of data.  Uses unused_path to ensure a
-    unique path is created.
-
-    Args:
-        data: string data for md5 hash.
-        directory: string path of directory to find path.
-        ext: path extension string.
-
-    Returns:
-        string path or None if could not be found.
-    """
-    if ext.find(os.path.sep) != -1:
-        raise ValueError('extension must not contain {}'.format(os.path.sep))
-
-    digest = md5.md5(data).hexdigest()
-    prefix = os.path.join(directory, digest)
-
-    path = unused_path(prefix, ext)
-    if path is not None:
-        path = os.path.basename(path)
-    return path
-
-
 def append_ext(path, ext):
     """Appends extension to path.
 
@@ -243,7 +207,11 @@ def test_create(path):
 
 def wsclean(s):
     """Replaces all blocks of whitespace and replaces with single space."""
-    return re.sub(r'\s+', ' ', s.strip())
+    # For byte strings split matches \s exactly.  unicode split also breaks
+    # on non-ASCII whitespace so it keeps the regex.
+    if type(s) is str:
+        return ' '.join(s.split())
+    return _WHITESPACE.sub(' ', s.strip())
 
 
 def getindex(obj, index, default=_NOINDEX):
@@ -293,11 +261,17 @@ def listreplace(lst, old, new, count=None):
     Returns:
         lst, does not make a copy.
     """
-    indices = allindex(lst, old)
-    if count is not None:
-        indices = indices[:count]
-    for index in indices:
+    # Replace while scanning so the search stops once count is reached.
+    index = 0
+    while count is None or count > 0:
+        try:
+            index = lst.index(old, index)
+        except ValueError:
+            break
         lst[index] = new
+        index += 1
+        if count is not None:
+            count -= 1
     return lst
 
 
@@ -320,15 +294,14 @@ def listfindremove(lst, pattern):
     Returns:
         If found match and lst is modified, None if not.
     """
-    if any([not isinstance(x, basestring) for x in lst]):
+    if not all(isinstance(x, STRING_TYPES) for x in lst):
         raise TypeError('lst must only contain strings')
 
     pattern = pattern.lower()
-    match = [x for x in lst if x.lower().find(pattern) != -1]
-    match = getindex(match, 0, None)
-    if match is not None:
-        listremove(lst, match)
-    return match
+    for index, x in enumerate(lst):
+        if pattern in x.lower():
+            return lst.pop(index)
+    return None
 
 
 def mapping_price_fmt(mapping, key='price', copy_mapping=True, fmt=PRICEFMT):
@@ -343,19 +316,22 @@ def mapping_price_fmt(mapping, key='price', copy_mapping=True, fmt=PRICEFMT):
     Returns:
         mapping or copy of mapping.
     """
-    if mapping.has_key(key) and isinstance(mapping[key], (int, float)):
+    if key in mapping and isinstance(mapping[key], (int, float)):
         if copy_mapping is True:
-            # Keep original mapping price as a number.
-            mapping = copy.deepcopy(mapping)
+            # Keep original mapping price as a number.  Only the price is
+            # replaced so a shallow copy is enough, dict types and RowDO
+            # copy their items when constructed from an instance.
+            mapping = type(mapping)(mapping)
         mapping[key] = fmt.format(mapping[key])
     return mapping
 
 
 def boolstr(value):
     """Value to bool handling True/False strings."""
-    if isinstance(value, basestring):
-        if value.lower() == 'false':
-            return False
+    if isinstance(value, STRING_TYPES):
+        ret = _BOOLSTR_WORDS.get(value.lower())
+        if ret is not None:
+            return ret
 
         try:
             value = float(value)
@@ -366,8 +342,8 @@ def boolstr(value):
 
 
 def isnonestr(value):
-    """Returns True if value is None or basestring."""
-    return value is None or isinstance(value, basestring)
+    """Returns True if value is None or a string."""
+    return value is None or isinstance(value, STRING_TYPES)
 
 
 def terms_split(terms):
@@ -385,7 +361,7 @@ def terms_split(terms):
     """
     if terms in ('', u'', None):
         return list()
-    elif isinstance(terms, basestring):
+    elif isinstance(terms, STRING_TYPES):
         terms = shlex.split(terms)
     elif isinstance(terms, collections.Iterable):
         terms = list(terms)
@@ -32,6 +32,11 @@ import re
 LISTING_PATH = './listing.csv'
 HTML_ROOT = './html'
 
+# Compiled dedent patterns by count.
+_dedent_res = {}
+# Dedented templates by (count, template).
+_dedent_cache = {}
+
 
 def makedirs(path, mode=0777):
     try:
@@ -44,18 +49,26 @@ def makedirs(path, mode=0777):
 
 
 def dedent(s, count):
-    pattern = r'^\s{{0,{}}}'.format(count)
-    s = s.split('\n')
-    s = [re.sub(pattern, '', x) for x in s]
-    s = '\n'.join(s)
-    return s
+    # Only called with the static page templates, dedent them before
+    # formatting so each is only processed once.
+    key = (count, s)
+    ret = _dedent_cache.get(key)
+    if ret is not None:
+        return ret
+
+    pattern = _dedent_res.get(count)
+    if pattern is None:
+        # Whitespace other than a newline so a match stays on its line.
+        pattern = re.compile(r'^[^\S\n]{{0,{}}}'.format(count), re.MULTILINE)
+        _dedent_res[count] = pattern
+    ret = pattern.sub('', s)
+    _dedent_cache[key] = ret
+    return ret
 
 
 def indent(s, count):
-    s = s.split('\n')
-    s = [' ' * count + x for x in s]
-    s = '\n'.join(s)
-    return s
+    prefix = ' ' * count
+    return prefix + s.replace('\n', '\n' + prefix)
 
 
 def ran_list_non_repeating(count, a, b):
@@ -63,9 +76,11 @@ def ran_list_non_repeating(count, a, b):
         raise ValueError('Impossible list count')
 
     ret = []
+    seen = set()
     while len(ret) != count:
         ran = random.randint(a, b)
-        if ran not in ret:
+        if ran not in seen:
+            seen.add(ran)
             ret.append(ran)
 
     return ret
@@ -78,14 +93,19 @@ def ran_split(lst, count):
     base = 100. / (count * 1.3)
     var = (100 - (base * count)) / count
 
+    low = int(base)
+    high = int(base + var)
+
+    # Slice from a running offset instead of re-slicing the remainder.
     ret = []
+    start = 0
     for x in range(count - 1):
-        ran = random.randint(int(base), int(base + var))
-        ran = int(ran / 100. * size)
-        ret.append(lst[:ran])
-        lst = lst[ran:]
+        ran = random.randint(low, high)
+        end = start + int(ran / 100. * size)
+        ret.append(lst[start:end])
+        start = end
 
-    ret.append(lst)
+    ret.append(lst[start:])
     random.shuffle(ret)
 
     return ret
@@ -95,12 +115,13 @@ def read_listing(path):
     listing_file = open(path, 'r')
     listing = csv.reader(listing_file, delimiter=',', quotechar='"')
     listing = list(listing)
+    listing_file.close()
     return listing
 
 
 def usa_gen_link_table(title, heading_list, link_list):
     # link_list is list of href, link text tuples.
-    ret = ''
+    parts = []
 
     s = """\
             <!DOCTYPE html>
@@ -119,16 +140,15 @@ def usa_gen_link_table(title, heading_list, link_list):
                                                 <table border=0 cellspacing=0 cellpadding=0 width="100%" align="center">
                                                     <tr class="bright">
                                                         <td class="page-title-text">\n"""
-    s = s.format(title=title)
-    s = dedent(s, 12)
-    ret += s
+    s = dedent(s, 12).format(title=title)
+    parts.append(s)
 
     if len(heading_list):
-        s = '<h2 class="page-hdr">{}</h2>\n'.format(heading_list[0])
+        s = ['<h2 class="page-hdr">{}</h2>'.format(heading_list[0])]
         for heading in heading_list[1:]:
-            s += '<h3 class="page-sub-hdr">{}</h3>\n'.format(heading)
-        s = indent(s[:-1], 48)
-        ret += s + '\n'
+            s.append('<h3 class="page-sub-hdr">{}</h3>'.format(heading))
+        s = indent('\n'.join(s), 48)
+        parts.append(s + '\n')
 
     s = """\
                 </td>
@@ -141,7 +161,7 @@ def usa_gen_link_table(title, heading_list, link_list):
                     <table cellpadding="0" cellspacing="0" border="0">
                         <tr>"""
     s = indent(s, 28)
-    ret += s + '\n'
+    parts.append(s + '\n')
 
     # Split list
     # Divide link_list in two, first half will be great if odd length.
@@ -149,15 +169,15 @@ def usa_gen_link_table(title, heading_list, link_list):
             link_list[(len(link_list) + 1) / 2:]]
     fmt = '    <a class="link" href="{href}">{text}</a><br>\n'
     for links in link_list:  # column
-        s = '<td align="left" nowrap valign="top" style="border: solid 2px ' \
-                '#403F3B; padding: 5px 5px 5px 5px;">\n'
+        s = ['<td align="left" nowrap valign="top" style="border: solid 2px '
+                '#403F3B; padding: 5px 5px 5px 5px;">\n']
 
         for href, text in links:
-            s += fmt.format(href=href, text=text)
+            s.append(fmt.format(href=href, text=text))
 
-        s += '</td>'
-        s = indent(s, 56)
-        ret += s + '\n'
+        s.append('</td>')
+        s = indent(''.join(s), 56)
+        parts.append(s + '\n')
 
 
     s = """\
@@ -176,9 +196,9 @@ def usa_gen_link_table(title, heading_list, link_list):
                 </body>
             </html>"""
     s = dedent(s, 12)
-    ret += s
+    parts.append(s)
 
-    return ret
+    return ''.join(parts)
 
 
 def usa_gen_lot(root, listing):
@@ -228,9 +248,8 @@ def usa_gen_lot(root, listing):
                     </div>
                 </body>
             </html>"""
-    html = html.format(lot_id=lot_id, img=img, desc=desc, price=price,
-            zipcode=zipcode)
-    html = dedent(html, 12)
+    html = dedent(html, 12).format(lot_id=lot_id, img=img, desc=desc,
+            price=price, zipcode=zipcode)
 
     lot_file = open(os.path.join(root, '{}.html'.format(lot_id)), 'w')
     lot_file.write(html)
@@ -298,8 +317,7 @@ def usa_gen_auctions(root, listing, au_count=4):
 
 
 def ll_gen_main(root, au_ids):
-    path = os.path.join(root, 'index.html')
-    html = open(path, 'w')
+    parts = []
 
     s = """\
             <!DOCTYPE html>
@@ -315,8 +333,8 @@ def ll_gen_main(root, au_ids):
 
                         <table cellpadding="0" cellspacing="0" border="0">"""
     s = dedent(s, 12)
-    html.write(s)
-    html.write('\n')
+    parts.append(s)
+    parts.append('\n')
 
     fmt = """\
                 <tr>
@@ -330,7 +348,7 @@ def ll_gen_main(root, au_ids):
     for au_id in au_ids:
         zipcode = '{:05d}'.format(random.randint(45500, 45599))
         s = fmt.format(au_id=au_id, zipcode=zipcode)
-        html.write(s)
+        parts.append(s)
 
     s = """\
                         </table>
@@ -338,17 +356,19 @@ def ll_gen_main(root, au_ids):
                 </div>
             </html>"""
     s = dedent(s, 12)
-    html.write(s)
-    html.write('\n')
+    parts.append(s)
+    parts.append('\n')
 
+    path = os.path.join(root, 'index.html')
+    html = open(path, 'w')
+    html.write(''.join(parts))
     html.close()
 
 
 def ll_gen_page(root, listing, au_id, page, page_count, times):
     times = [x.strftime('%Y-%m-%d %H:%M:%S') for x in times]
 
-    path = os.path.join(root, '{}.html'.format(page))
-    html = open(path, 'w')
+    parts = []
 
     s = """\
             <!DOCTYPE html>
@@ -365,25 +385,25 @@ def ll_gen_page(root, listing, au_id, page, page_count, times):
                         <p class="general">Opens: {opens}</p>
                         <p class="general">Closes: {closes}</p>
 
-                        <p>""".format(au_id=au_id, page=page, opens=times[0],
-                                closes=times[1])
-    s = dedent(s, 12)
-    html.write(s)
-    html.write('\n')
+                        <p>"""
+    s = dedent(s, 12).format(au_id=au_id, page=page, opens=times[0],
+            closes=times[1])
+    parts.append(s)
+    parts.append('\n')
 
     pages = [[x, x] for x in range(1, page_count + 1)]
     pages[page - 1][1] = '<font color=red>{}</font>'.format(page)
     pages = ['{}<a ID=ayty href="{}.html">{}</a>'.format(' ' * 16, x[0], x[1])
             for x in pages]
-    html.write('\n'.join(pages))
-    html.write('\n')
+    parts.append('\n'.join(pages))
+    parts.append('\n')
 
     s = """\
             </p>
 
             <div class="view-past-lots">"""
-    html.write(s)
-    html.write('\n')
+    parts.append(s)
+    parts.append('\n')
 
     for img, desc, price in listing:
         s = """\
@@ -402,8 +422,8 @@ def ll_gen_page(root, listing, au_id, page, page_count, times):
                 </div>
                 """.format(img=img, lot=random.randint(0, 999999), desc=desc,
                         price=price)
-        html.write(s)
-        html.write('\n')
+        parts.append(s)
+        parts.append('\n')
 
     s = """\
                         </div>
@@ -411,9 +431,12 @@ def ll_gen_page(root, listing, au_id, page, page_count, times):
                 </div>
             </html>"""
     s = dedent(s, 12)
-    html.write(s)
-    html.write('\n')
+    parts.append(s)
+    parts.append('\n')
 
+    path = os.path.join(root, '{}.html'.format(page))
+    html = open(path, 'w')
+    html.write(''.join(parts))
     html.close()
 
 
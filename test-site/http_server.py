@@ -2,9 +2,16 @@
 
 import BaseHTTPServer
 import SimpleHTTPServer
+import SocketServer
 import sys
 
 
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn,
+        BaseHTTPServer.HTTPServer):
+    # Serve each request in its own thread, don't wait on them at exit.
+    daemon_threads = True
+
+
 if len(sys.argv) > 1:
     port = int(sys.argv[1])
 else:
@@ -12,7 +19,7 @@ else:
 
 server_address = ('127.0.0.1', port)
 
-httpd = BaseHTTPServer.HTTPServer(server_address,
+httpd = ThreadingHTTPServer(server_address,
         SimpleHTTPServer.SimpleHTTPRequestHandler)
 
 print('Serving HTTP on {} port {} ...'.format(*server_address))